@@ -0,0 +1,343 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from fingerprint_recognizer.fft_matching import FFTEngine
+from fingerprint_recognizer.image_locator import ImageLocator
+from fingerprint_recognizer.template_store import TemplateStore
+from fingerprint_recognizer.utils import metrics
+
+
+RESOURCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fingerprint_recognizer", "resources")
+MATCHERS = ("locate_images_on_screen", "orb_matching", "ssim_matching", "locate_objects")
+ENGINES = ("direct", "fft")
+
+# Startup paths timed by --startup, each in a fresh interpreter
+STARTUP_TARGETS = {
+    'import_package': "import fingerprint_recognizer",
+    'import_locator': "from fingerprint_recognizer import ImageLocator",
+    'import_batch': "from fingerprint_recognizer.batch import BatchDetector",
+    'open_templates': f"from fingerprint_recognizer.template_pack import open_templates; open_templates({RESOURCES_PATH!r})",
+    'cli_help': "import runpy, sys; sys.argv = ['main.py', '--help']; runpy.run_path('main.py', run_name='__main__')",
+}
+# Modules the matching-only paths are not supposed to load
+HEAVY_MODULES = ("PyQt5", "keyboard", "textual", "pyautogui", "mss", "skimage")
+
+
+def parse_resolution(text):
+    """Parse "1920x1080" into (width, height)."""
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def paste(scene, image, x, y):
+    """Alpha-blend a BGR(A) image onto the scene at (x, y)."""
+    h, w = image.shape[:2]
+    target = scene[y:y + h, x:x + w]
+    if image.ndim == 3 and image.shape[2] == 4:
+        alpha = image[:, :, 3:4].astype(np.float32) / 255.0
+        target[:] = (image[:, :, :3] * alpha + target * (1.0 - alpha)).astype(np.uint8)
+    else:
+        target[:] = image[:, :, :3] if image.ndim == 3 else image[:, :, None]
+
+
+def make_scene(resolution, main_name, scale, rng):
+    """
+    Build a synthetic keypad screenshot.
+
+    The main print and its fragments are pasted at the given scale onto a blurred noise background,
+    the fragments in a grid to the left of the main print as in the heist minigame.
+
+    :return: (BGR screenshot, list of ground-truth dicts with path, x, y, width, height)
+    """
+    width, height = resolution
+    noise = rng.integers(0, 256, (height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8)
+    scene = cv2.resize(noise, (width, height), interpolation=cv2.INTER_LINEAR)
+    scene = cv2.GaussianBlur(scene, (9, 9), 0)
+    scene = cv2.add(scene, rng.integers(0, 24, scene.shape, dtype=np.uint8))
+
+    main_path = os.path.join(RESOURCES_PATH, f"{main_name}.png")
+    fragment_dir = os.path.join(RESOURCES_PATH, main_name)
+    fragment_paths = sorted(os.path.join(fragment_dir, f) for f in os.listdir(fragment_dir) if f.endswith(".png"))
+
+    main = cv2.resize(cv2.imread(main_path, cv2.IMREAD_UNCHANGED), None, fx=scale, fy=scale)
+    fragments = [cv2.resize(cv2.imread(p, cv2.IMREAD_UNCHANGED), None, fx=scale, fy=scale) for p in fragment_paths]
+
+    cell = max(f.shape[0] for f in fragments) + int(20 * scale)
+    grid_w = 2 * cell
+    total_w = grid_w + int(60 * scale) + main.shape[1]
+    total_h = max(main.shape[0], 2 * cell)
+    x0 = int(rng.integers(0, max(1, width - total_w)))
+    y0 = int(rng.integers(0, max(1, height - total_h)))
+
+    truth = []
+    for i, (path, fragment) in enumerate(zip(fragment_paths, fragments)):
+        x = x0 + (i % 2) * cell
+        y = y0 + (i // 2) * cell
+        paste(scene, fragment, x, y)
+        truth.append({'path': path, 'x': x, 'y': y, 'width': fragment.shape[1], 'height': fragment.shape[0]})
+
+    x = x0 + grid_w + int(60 * scale)
+    paste(scene, main, x, y0)
+    truth.append({'path': main_path, 'x': x, 'y': y0, 'width': main.shape[1], 'height': main.shape[0]})
+    return scene, truth
+
+
+def iou(a, b):
+    """Intersection over union of two dicts with x, y, width, height."""
+    w = min(a['x'] + a['width'], b['x'] + b['width']) - max(a['x'], b['x'])
+    h = min(a['y'] + a['height'], b['y'] + b['height']) - max(a['y'], b['y'])
+    if w <= 0 or h <= 0:
+        return 0.0
+    intersection = w * h
+    return intersection / float(a['width'] * a['height'] + b['width'] * b['height'] - intersection)
+
+
+def count_hits(matches, truth, min_iou=0.5):
+    """Greedily pair detections with ground-truth boxes, return (true positives, detections, ground truth)."""
+    unmatched = list(truth)
+    hits = 0
+    for match in sorted(matches, key=lambda m: -m.get('score', 0.0)):
+        best = max(unmatched, key=lambda t: iou(match, t), default=None)
+        if best is not None and iou(match, best) >= min_iou:
+            unmatched.remove(best)
+            hits += 1
+    return hits, len(matches), len(truth)
+
+
+def run_matcher(locator, name, screenshot):
+    """Run one matcher and return (matches, seconds, peak traced bytes)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    matches = getattr(locator, name)(screenshot)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return matches, elapsed, peak
+
+
+def summarize(name, engine, resolution, timings, peaks, hits, detections, truths):
+    """Aggregate the runs of one matcher and engine at one resolution."""
+    timings_ms = np.array(timings) * 1000
+    return {
+        'matcher': name,
+        'engine': engine,
+        'resolution': f"{resolution[0]}x{resolution[1]}",
+        'runs': len(timings),
+        'p50_ms': float(np.percentile(timings_ms, 50)),
+        'p95_ms': float(np.percentile(timings_ms, 95)),
+        'peak_memory_mb': max(peaks) / (1024 * 1024),
+        'precision': hits / detections if detections else 0.0,
+        'recall': hits / truths if truths else 0.0,
+    }
+
+
+def git_commit():
+    """Return the current commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """Return the commit and platform details stored with every report."""
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'machine': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def time_startup(code, repeats):
+    """Run code in fresh interpreters, return (wall times in seconds, heavy modules it imported)."""
+    body = "\n".join("    " + line for line in code.splitlines())
+    report = f"print('heavy:' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules), file=sys.stderr)"
+    probe = f"import sys\ntry:\n{body}\nexcept SystemExit:\n    pass\n{report}\n"  # --help exits
+    timings = []
+    loaded = ""
+    for _ in range(repeats):
+        start = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, "-c", probe], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        timings.append(time.perf_counter() - start)
+        lines = process.stderr.strip().splitlines()
+        if process.returncode == 0 and lines and lines[-1].startswith("heavy:"):
+            loaded = lines[-1][len("heavy:"):]
+        else:
+            loaded = f"failed: {lines[-1] if lines else process.returncode}"
+    return timings, loaded
+
+
+def run_startup(repeats):
+    """Time every startup path against a bare interpreter and return the report dict."""
+    baseline, _ = time_startup("pass", repeats)
+    baseline_ms = float(np.median(baseline)) * 1000
+    print(f"{'interpreter':<16} p50 {baseline_ms:8.1f} ms")
+
+    results = []
+    for name, code in STARTUP_TARGETS.items():
+        timings, loaded = time_startup(code, repeats)
+        timings_ms = np.array(timings) * 1000
+        result = {
+            'target': name,
+            'runs': repeats,
+            'p50_ms': float(np.percentile(timings_ms, 50)),
+            'p95_ms': float(np.percentile(timings_ms, 95)),
+            'p50_over_interpreter_ms': float(np.percentile(timings_ms, 50)) - baseline_ms,
+            'heavy_modules': loaded,
+        }
+        results.append(result)
+        print(
+            f"{name:<16} p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms  "
+            f"heavy modules: {loaded or '-'}"
+        )
+
+    return dict(environment(), interpreter_ms=baseline_ms, startup=results)
+
+
+def check_engines(store, samples, max_difference=1e-4):
+    """
+    Check that the fft engine gives the results of the direct one on the scenes of a resolution.
+
+    Every template of a scene is correlated at every scale by both engines and the exhaustive search
+    is run with each of them, the maps must agree within max_difference and the matches must be equal.
+    """
+    engine = FFTEngine()
+    difference = 0.0
+    same_matches = True
+    for _, (screenshot, truth) in samples:
+        gray = cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY)
+        for path in {t['path'] for t in truth}:
+            for scale, template in ImageLocator(template_store=store).scaled_templates(store.get(path), store.scales):
+                if template.shape[0] > gray.shape[0] or template.shape[1] > gray.shape[1]:
+                    continue
+                expected = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
+                actual = engine.match_template(gray, template, key=(path, scale))
+                difference = max(difference, float(np.abs(expected - actual).max()))
+
+        found = []
+        for name in ENGINES:
+            locator = ImageLocator(template_store=store, match_engine=name)
+            locator.load_templates([t['path'] for t in truth])
+            found.append(sorted((m['path'], m['x'], m['y'], m['scale']) for m in locator.locate_images_on_screen(screenshot)))
+            locator.close()
+        same_matches = same_matches and found[0] == found[1]
+
+    return {'max_difference': difference, 'same_matches': same_matches,
+            'identical': same_matches and difference <= max_difference}
+
+
+def run(resolutions, scales, scenes, matchers, pyramid_levels, seed, engines=("direct",)):
+    """Run every matcher with every engine on synthetic scenes and return the report dict."""
+    rng = np.random.default_rng(seed)
+    metrics.enable()
+    store = TemplateStore(RESOURCES_PATH)
+    store.preload()
+    main_names = sorted(os.path.splitext(f)[0] for f in os.listdir(RESOURCES_PATH) if f.endswith(".png"))
+
+    results = []
+    checks = []
+    for resolution in resolutions:
+        samples = []
+        for i in range(scenes):
+            main_name = main_names[i % len(main_names)]
+            samples.append((main_name, make_scene(resolution, main_name, scales[i % len(scales)], rng)))
+
+        if "fft" in engines:
+            check = dict(check_engines(store, samples), resolution=f"{resolution[0]}x{resolution[1]}")
+            checks.append(check)
+            print(
+                f"{'engine check':<24} {check['resolution']:>10}  max difference {check['max_difference']:.2e}  "
+                f"same matches {check['same_matches']}"
+            )
+
+        for name, engine in ((name, engine) for name in matchers for engine in engines):
+            locator = ImageLocator(template_store=store, pyramid_levels=pyramid_levels, pyramid_fallback=True,
+                                   match_engine=engine)
+            metrics.reset()
+            timings, peaks = [], []
+            hits = detections = truths = 0
+            for main_name, (screenshot, truth) in samples:
+                locator.load_templates([t['path'] for t in truth])
+                matches, elapsed, peak = run_matcher(locator, name, screenshot)
+                found, detected, expected = count_hits(matches, truth)
+                timings.append(elapsed)
+                peaks.append(peak)
+                hits += found
+                detections += detected
+                truths += expected
+            locator.close()
+
+            result = summarize(name, engine, resolution, timings, peaks, hits, detections, truths)
+            result.update(metrics.summary())
+            results.append(result)
+            print(
+                f"{result['matcher']:<24} {engine:<6} {result['resolution']:>10}  p50 {result['p50_ms']:8.1f} ms  "
+                f"p95 {result['p95_ms']:8.1f} ms  peak {result['peak_memory_mb']:7.1f} MB  "
+                f"precision {result['precision']:.2f}  recall {result['recall']:.2f}"
+            )
+
+    return dict(
+        environment(),
+        settings={
+            'resolutions': [f"{w}x{h}" for w, h in resolutions],
+            'scales': scales,
+            'scenes': scenes,
+            'pyramid_levels': pyramid_levels,
+            'engines': list(engines),
+            'seed': seed,
+        },
+        results=results,
+        engine_checks=checks,
+    )
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark the matchers of ImageLocator on synthetic keypad screenshots.")
+    parser.add_argument("--resolutions", nargs="+", type=parse_resolution, default=[(1920, 1080), (2560, 1440)],
+                        help="Screenshot sizes, e.g. 1920x1080 3840x2160.")
+    parser.add_argument("--scales", nargs="+", type=float, default=[0.7, 0.85, 1.0, 1.33],
+                        help="UI scales the templates are pasted at (cycled over the scenes), the default mixes "
+                             "scales on and off the 0.5 sweep grid so that recall shows scale regressions.")
+    parser.add_argument("--scenes", type=int, default=4, help="Synthetic screenshots per resolution.")
+    parser.add_argument("--matchers", nargs="+", choices=MATCHERS, default=list(MATCHERS))
+    parser.add_argument("--pyramid-levels", type=int, default=2, help="Pyramid depth of locate_images_on_screen.")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=["direct"],
+                        help="Correlation engines to compare, fft also checks that both give identical results.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON report to write.")
+    parser.add_argument("--startup", action="store_true",
+                        help="Time the import and startup paths in fresh interpreters instead of the matchers.")
+    parser.add_argument("--repeats", type=int, default=5, help="Interpreters started per startup path.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.startup:
+        report = run_startup(args.repeats)
+    else:
+        report = run(args.resolutions, args.scales, args.scenes, args.matchers, args.pyramid_levels, args.seed,
+                     args.engines)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Report written to {args.output}")
+    if not all(check['identical'] for check in report.get('engine_checks', [])):
+        sys.exit("The fft engine does not give the results of the direct engine.")
@@ -1,3 +1,35 @@
-from .image_locator import ImageLocator
-from .overlay import RectangleOverlay
-from .recognizer import FingerprintRecognizer
+# Submodules are imported on first access, so the matching classes can be used without pulling in
+# PyQt5, keyboard or the capture backends
+_EXPORTS = {
+    'ImageLocator': "image_locator",
+    'RectangleOverlay': "overlay",
+    'FingerprintRecognizer': "recognizer",
+    'TemplateStore': "template_store",
+    'TemplatePack': "template_pack",
+    'build_pack': "template_pack",
+    'open_templates': "template_pack",
+    'ScreenCapture': "capture",
+    'MSSCapture': "capture",
+    'PyAutoGUICapture': "capture",
+    'ArrayCapture': "capture",
+    'create_capture': "capture",
+    'ScaleCalibration': "calibration",
+    'BatchDetector': "batch",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    from importlib import import_module
+    value = getattr(import_module(f".{module_name}", __name__), name)
+    globals()[name] = value  # Later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
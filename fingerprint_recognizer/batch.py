@@ -0,0 +1,188 @@
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+from .image_locator import ImageLocator
+from .template_pack import open_templates
+from .utils.logger import log
+
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+
+_DONE = object()  # End-of-stream marker passed down the pipeline
+
+
+def iter_frames(source):
+    """
+    Yield (name, BGR frame) from a folder of screenshots (sorted by file name) or a video file.
+
+    Unreadable images are skipped with a warning.
+    """
+    if os.path.isdir(source):
+        for file in sorted(os.listdir(source)):
+            if not file.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            path = os.path.join(source, file)
+            frame = cv2.imread(path, cv2.IMREAD_COLOR)
+            if frame is None:
+                log("Failed to load image: %s", path, level="warning")
+                continue
+            yield path, frame
+        return
+
+    video = cv2.VideoCapture(source)
+    if not video.isOpened():
+        raise ValueError(f"Cannot open {source}, expected a folder of images or a video file.")
+    try:
+        index = 0
+        while True:
+            ok, frame = video.read()
+            if not ok:
+                break
+            yield f"{source}#{index}", frame
+            index += 1
+    finally:
+        video.release()
+
+
+class BatchDetector:
+    def __init__(self, resources_path, threshold=0.75, pyramid_levels=2, queue_size=4, template_store=None):
+        """
+        Run the keypad detection over recorded frames in a streaming pipeline.
+
+        decode -> preprocess -> match -> NMS each run on their own thread, connected by bounded queues
+        so a frame can be decoded while the previous one is matched without buffering the whole input.
+
+        :param resources_path: Path to the resources directory.
+        :param threshold: Matching threshold for image detection.
+        :param pyramid_levels: Depth of the coarse-to-fine search (0 searches the full resolution only).
+        :param queue_size: Frames that may wait between two stages.
+        :param template_store: Optional TemplateStore or TemplatePack to share, see open_templates() otherwise.
+        """
+        if template_store is None:
+            template_store = open_templates(resources_path)
+        self.template_store = template_store
+        self.main_paths = template_store.main_template_paths()
+        self.locator = ImageLocator(
+            threshold=threshold,
+            pyramid_levels=pyramid_levels,
+            pyramid_fallback=True,
+            template_store=template_store,
+        )
+        self.queue_size = queue_size
+
+    def preprocess(self, record):
+        """Stage 2: blurred grayscale screenshot and pyramid."""
+        record['gray'], record['pyramid'] = self.locator.prepare_screenshot(record.pop('frame'))
+
+    def match(self, record):
+        """Stage 3: locate the main print, then match the fragments of the best one."""
+        gray, pyramid = record.pop('gray'), record.pop('pyramid')
+
+        self.locator.load_templates(self.main_paths)
+        main_templates = self.locator.templates
+        main_candidates = self.locator.match_candidates(gray, pyramid)
+        # The main print decides which fragments to look for, so its suppression cannot wait for stage 4
+        main_locations = self.locator.suppress_candidates(main_candidates, main_templates)
+
+        record['main'] = main_locations[0] if main_locations else None
+        record['fragment_candidates'] = {}
+        record['fragment_templates'] = []
+        if main_locations:
+            self.locator.load_templates(self.template_store.fragment_paths(main_locations[0]['path']))
+            record['fragment_templates'] = self.locator.templates
+            record['fragment_candidates'] = self.locator.match_candidates(gray, pyramid)
+
+    def suppress(self, record):
+        """Stage 4: non-maximum suppression of the fragment candidates."""
+        record['fragments'] = self.locator.suppress_candidates(
+            record.pop('fragment_candidates'), record.pop('fragment_templates')
+        )
+
+    def _run_stage(self, name, function, inbox, outbox):
+        """Apply a stage to every record of inbox and pass it on, failed records carry the error."""
+        while True:
+            record = inbox.get()
+            if record is _DONE:
+                outbox.put(_DONE)
+                return
+
+            if 'error' not in record:
+                start = time.perf_counter()
+                try:
+                    function(record)
+                except Exception as e:
+                    record['error'] = f"{name}: {e}"
+                record['timings_ms'][name] = (time.perf_counter() - start) * 1000
+            outbox.put(record)
+
+    def _decode(self, source, outbox, errors):
+        """Stage 1: read frames into the pipeline, a source that cannot be read ends up in errors."""
+        frames = iter_frames(source)
+        index = 0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    name, frame = next(frames)
+                except StopIteration:
+                    break
+                outbox.put({
+                    'frame': frame,
+                    'index': index,
+                    'source': name,
+                    'timings_ms': {'decode': (time.perf_counter() - start) * 1000},
+                })
+                index += 1
+        except Exception as e:
+            log("Stopped reading %s: %s", source, e, level="error")
+            errors.append(e)
+        finally:
+            outbox.put(_DONE)
+
+    def run(self, source):
+        """
+        Process every frame of a folder or video and yield one JSON-ready dict per frame, in order.
+
+        Each dict holds the frame index and source, the main print match (or None), the fragment
+        matches, the per-stage timings and, if a stage failed, the error.
+
+        :raises OSError: If source does not exist.
+        :raises ValueError: If source cannot be opened, or the error that stopped reading it, once the
+            frames read before it were yielded.
+        """
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"No such folder or video: {source}")
+
+        errors = []
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(4)]
+        threads = [threading.Thread(target=self._decode, args=(source, queues[0], errors), daemon=True)]
+        stages = (("preprocess", self.preprocess), ("match", self.match), ("nms", self.suppress))
+        for (name, function), inbox, outbox in zip(stages, queues, queues[1:]):
+            threads.append(threading.Thread(target=self._run_stage, args=(name, function, inbox, outbox), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        while True:
+            record = queues[-1].get()
+            if record is _DONE:
+                break
+
+            for key in ('frame', 'gray', 'pyramid', 'fragment_candidates', 'fragment_templates'):
+                record.pop(key, None)
+            record.setdefault('main', None)
+            record.setdefault('fragments', [])
+            record['timings_ms']['total'] = sum(record['timings_ms'].values())
+            yield record
+
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        """Shut down the matching worker pool."""
+        self.locator.close()
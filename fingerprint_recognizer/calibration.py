@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from .utils.logger import log
+
+
+DEFAULT_CALIBRATION_PATH = os.path.join(os.path.expanduser("~"), ".fingerprint_recognizer", "calibration.json")
+
+
+def resolution_key(screen_size):
+    """Return the "WIDTHxHEIGHT" key of a (height, width) screen size."""
+    return f"{screen_size[1]}x{screen_size[0]}"
+
+
+class ScaleCalibration:
+    def __init__(self, path=None, band=0.05, fine_step=0.01, min_score=0.8):
+        """
+        Remember the template scale, keypad region and fragment slots per screen resolution.
+
+        :param path: JSON file the calibration is persisted to, None keeps it in memory only.
+        :param band: Half-width of the scale band searched around the calibrated scale.
+        :param fine_step: Step between two scales inside the band.
+        :param min_score: A calibrated search scoring below this re-widens to the full sweep.
+        """
+        self.path = path
+        self.band = band
+        self.fine_step = fine_step
+        self.min_score = min_score
+        self.entries = {}
+        self.dirty = False  # Changed since the last save
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Read the persisted calibration, a missing or broken file starts empty."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                self.entries = json.load(file)
+        except (OSError, ValueError) as e:
+            log(f"Ignoring calibration file {self.path}: {e}", level="warning")
+            self.entries = {}
+
+    def save(self):
+        """Write the calibration to disk, if a path is configured and something changed."""
+        if not self.path or not self.dirty:
+            return
+        with self._lock:
+            entries = dict(self.entries)
+            self.dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as file:
+                json.dump(entries, file, indent=2)
+        except OSError as e:
+            log(f"Could not save calibration to {self.path}: {e}", level="warning")
+
+    def get(self, screen_size):
+        """Return the calibration entry of a (height, width) screen size, or None."""
+        if screen_size is None:
+            return None
+        return self.entries.get(resolution_key(screen_size))
+
+    def update(self, screen_size, scale, score):
+        """
+        Store the scale of a confident match for a screen size, the known region is kept.
+
+        The score alone changing on every hit does not make the calibration dirty, it is written with the next change.
+        """
+        key = resolution_key(screen_size)
+        with self._lock:
+            entry = dict(self.entries.get(key, {}))
+            scale = round(float(scale), 4)
+            self.dirty = self.dirty or entry.get('scale') != scale
+            entry['scale'] = scale
+            entry['score'] = round(float(score), 4)
+            self.entries[key] = entry
+
+    def _set(self, screen_size, name, value):
+        """Store one value of a screen size's entry, marking the calibration dirty if it changed."""
+        key = resolution_key(screen_size)
+        with self._lock:
+            entry = dict(self.entries.get(key, {}))
+            if entry.get(name) == value:
+                return
+            entry[name] = value
+            self.entries[key] = entry
+            self.dirty = True
+
+    def set_region(self, screen_size, region):
+        """Store the (x, y, width, height) keypad region of a screen size."""
+        self._set(screen_size, 'region', [int(value) for value in region])
+
+    def set_slots(self, screen_size, slots):
+        """Store the fragment slots of a screen size, see KeypadLayout."""
+        self._set(screen_size, 'slots', [[round(float(value), 4) for value in slot] for slot in slots])
+
+    def reset(self, screen_size):
+        """Forget the calibrated scale of a screen size, the region and slots are kept."""
+        key = resolution_key(screen_size)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry and 'scale' in entry:
+                self.entries[key] = {k: v for k, v in entry.items() if k not in ('scale', 'score')}
+                self.dirty = True
+
+    def scales(self, screen_size, band=None):
+        """Return the fine scales around the calibrated scale, or None when the screen size is not calibrated."""
+        entry = self.get(screen_size)
+        if entry is None or 'scale' not in entry:
+            return None
+        return self.band_scales(entry['scale'], band)
+
+    def band_scales(self, scale, band=None):
+        """Return the fine scales of the band around a scale."""
+        band = self.band if band is None else band
+        steps = int(round(band / self.fine_step))
+        scales = scale + self.fine_step * np.arange(-steps, steps + 1)
+        return [round(float(scale), 4) for scale in scales if scale > 0]
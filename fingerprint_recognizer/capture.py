@@ -0,0 +1,183 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class ScreenCapture:
+    """
+    Base class of the capture backends.
+
+    grab() returns a BGR (or grayscale) frame of the whole screen or of a region (x, y, width, height).
+    The returned array is a buffer that is reused by the next grab() call, copy it if you keep it around.
+    """
+
+    def __init__(self):
+        self._buffers = threading.local()
+
+    def grab(self, region=None, grayscale=False):
+        raise NotImplementedError
+
+    def screen_size(self):
+        """Return the (height, width) of the full screen."""
+        raise NotImplementedError
+
+    def close(self):
+        """Release the resources held by the backend."""
+
+    def _buffer(self, shape):
+        """Return the reusable output buffer of this thread for the given shape."""
+        buffers = getattr(self._buffers, "arrays", None)
+        if buffers is None:
+            buffers = self._buffers.arrays = {}
+        buffer = buffers.get(shape)
+        if buffer is None:
+            buffer = buffers[shape] = np.empty(shape, dtype=np.uint8)
+        return buffer
+
+    def _convert(self, frame, code_bgr, code_gray, grayscale):
+        """Convert a raw frame straight into the reusable buffer."""
+        h, w = frame.shape[:2]
+        if grayscale:
+            return cv2.cvtColor(frame, code_gray, dst=self._buffer((h, w)))
+        return cv2.cvtColor(frame, code_bgr, dst=self._buffer((h, w, 3)))
+
+
+class PyAutoGUICapture(ScreenCapture):
+    """Capture through pyautogui.screenshot(), works everywhere pyautogui does but copies the frame a few times."""
+
+    def grab(self, region=None, grayscale=False):
+        import pyautogui
+
+        screenshot = pyautogui.screenshot(region=tuple(region) if region else None)
+        return self._convert(np.asarray(screenshot), cv2.COLOR_RGB2BGR, cv2.COLOR_RGB2GRAY, grayscale)
+
+    def screen_size(self):
+        import pyautogui
+
+        width, height = pyautogui.size()
+        return height, width
+
+
+class MSSCapture(ScreenCapture):
+    """Low-overhead capture through mss, the raw BGRA frame is converted directly into a reusable buffer."""
+
+    def __init__(self, monitor=1):
+        super().__init__()
+        import mss  # Optional dependency, create_capture() falls back to pyautogui without it
+
+        self._mss = mss
+        self.monitor = monitor
+        self._local = threading.local()  # mss handles must not be shared between threads
+
+    def _sct(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            sct = self._local.sct = self._mss.mss()
+        return sct
+
+    def grab(self, region=None, grayscale=False):
+        sct = self._sct()
+        monitor = sct.monitors[self.monitor]
+        if region:
+            x, y, w, h = region
+            monitor = {"left": monitor["left"] + x, "top": monitor["top"] + y, "width": w, "height": h}
+
+        shot = sct.grab(monitor)
+        frame = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        return self._convert(frame, cv2.COLOR_BGRA2BGR, cv2.COLOR_BGRA2GRAY, grayscale)
+
+    def screen_size(self):
+        monitor = self._sct().monitors[self.monitor]
+        return monitor["height"], monitor["width"]
+
+    def close(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is not None:
+            sct.close()
+            self._local.sct = None
+
+
+class ArrayCapture(ScreenCapture):
+    """
+    Stand-in backend that replays frames from arrays or image files, e.g. to benchmark on a headless box.
+
+    :param frames: A BGR array, a path, or a list of those. Frames are returned round-robin.
+    """
+
+    def __init__(self, frames):
+        super().__init__()
+        if isinstance(frames, (str, np.ndarray)):
+            frames = [frames]
+
+        self.frames = []
+        for frame in frames:
+            if isinstance(frame, str):
+                image = cv2.imread(frame, cv2.IMREAD_COLOR)
+                if image is None:
+                    raise ValueError(f"Failed to load image: {frame}")
+                frame = image
+            self.frames.append(frame)
+
+        if not self.frames:
+            raise ValueError("ArrayCapture needs at least one frame.")
+        self._next = 0
+
+    def grab(self, region=None, grayscale=False):
+        frame = self.frames[self._next]
+        self._next = (self._next + 1) % len(self.frames)
+
+        if region:
+            x, y, w, h = region
+            frame = frame[y:y + h, x:x + w]
+
+        if frame.ndim == 2:
+            if grayscale:
+                out = self._buffer(frame.shape)
+                np.copyto(out, frame)
+                return out
+            return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR, dst=self._buffer(frame.shape + (3,)))
+
+        if grayscale:
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._buffer(frame.shape[:2]))
+        out = self._buffer(frame.shape)
+        np.copyto(out, frame)
+        return out
+
+    def screen_size(self):
+        return self.frames[self._next].shape[:2]
+
+
+def create_capture(backend="auto"):
+    """
+    Create a capture backend by name.
+
+    :param backend: "mss", "pyautogui" or "auto" (mss when it is installed, pyautogui otherwise).
+    """
+    if backend in ("auto", "mss"):
+        try:
+            return MSSCapture()
+        except ImportError:
+            if backend == "mss":
+                raise
+    if backend in ("auto", "pyautogui"):
+        return PyAutoGUICapture()
+    raise ValueError(f"Unknown capture backend: {backend}")
+
+
+def measure_capture(capture, frames=100, region=None, grayscale=False):
+    """Grab a number of frames and return the mean and worst capture time in milliseconds and the FPS."""
+    timings = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        capture.grab(region=region, grayscale=grayscale)
+        timings.append(time.perf_counter() - start)
+
+    mean = sum(timings) / len(timings)
+    return {
+        'frames': frames,
+        'mean_ms': mean * 1000,
+        'max_ms': max(timings) * 1000,
+        'fps': 1.0 / mean if mean else float('inf'),
+    }
@@ -0,0 +1,72 @@
+import threading
+
+import cv2
+import numpy as np
+
+from .template_store import preprocess_template
+
+
+def descriptor(image, size=16):
+    """
+    Return the fixed-length descriptor of a grayscale image: a size x size thumbnail, zero mean, unit norm.
+
+    The dot product of two descriptors is the normalized cross-correlation of the thumbnails.
+    """
+    thumbnail = cv2.resize(image, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+    thumbnail -= thumbnail.mean()
+    norm = np.linalg.norm(thumbnail)
+    return thumbnail / norm if norm > 0 else thumbnail
+
+
+class DescriptorIndex:
+    def __init__(self, size=16):
+        """
+        Descriptors of many templates in one contiguous (n, size * size) float32 array.
+
+        Identifying crops is a single matrix multiply, so the cost barely grows with the library.
+        """
+        self.size = size
+        self.paths = []
+        self.rows = {}  # path -> row of vectors
+        self.vectors = np.empty((0, size * size), dtype=np.float32)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add(self, entries):
+        """Add template dicts (see ImageLocator.load_templates()) that are not indexed yet."""
+        new = [entry for entry in entries if entry['path'] not in self.rows]
+        if not new:
+            return
+        vectors = np.stack([
+            descriptor(entry['blurred'] if 'blurred' in entry else preprocess_template(entry['grayscale']), self.size)
+            for entry in new
+        ])
+        with self._lock:
+            for entry in new:
+                self.rows[entry['path']] = len(self.paths)
+                self.paths.append(entry['path'])
+            self.vectors = np.ascontiguousarray(np.concatenate([self.vectors, vectors]))
+
+    def similarities(self, images, paths=None):
+        """
+        Return the (len(images), len(paths)) similarities in [-1, 1] of blurred grayscale images to templates.
+
+        paths restricts the columns to these templates (in that order), every indexed template otherwise.
+        """
+        with self._lock:
+            vectors = self.vectors if paths is None else self.vectors[[self.rows[path] for path in paths]]
+        if not len(images):
+            return np.empty((0, len(vectors)), dtype=np.float32)
+        queries = np.stack([descriptor(image, self.size) for image in images])
+        return queries @ vectors.T
+
+    def nearest(self, images, paths=None):
+        """Return (paths, similarities) of the best template for every image."""
+        columns = self.paths if paths is None else list(paths)
+        scores = self.similarities(images, paths)
+        if not columns:
+            return [None] * len(images), np.zeros(len(images), dtype=np.float32)
+        best = scores.argmax(axis=1)
+        return [columns[i] for i in best], scores[np.arange(len(images)), best]
@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from .similarity import integral_tables, window_sums
+
+
+class FFTFrame:
+    def __init__(self, image):
+        """
+        Per-frame half of the FFT correlation: the spectrum and integral images of a grayscale image.
+
+        The spectrum is padded to an optimal DFT size covering the image, which is enough for the
+        valid part of the correlation with any template, so every template reuses it.
+        """
+        self.image = image
+        height, width = image.shape[:2]
+        self.dft_shape = (cv2.getOptimalDFTSize(height), cv2.getOptimalDFTSize(width))
+        padded = np.zeros(self.dft_shape, dtype=np.float32)
+        padded[:height, :width] = image
+        self.spectrum = cv2.dft(padded)  # Packed (CCS) spectrum of a real image
+        self.tables = integral_tables(image)
+        self._deviations = {}  # (h, w) -> window standard deviations times sqrt(h * w)
+
+    def window_deviations(self, h, w):
+        """Return sqrt(sum((window - window mean) ** 2)) of every h x w window, shared by same-sized templates."""
+        deviations = self._deviations.get((h, w))
+        if deviations is None:
+            sums, squares = window_sums(self.image, h, w, self.tables)
+            deviations = self._deviations[(h, w)] = np.sqrt(np.maximum(squares - sums * sums / (h * w), 0.0)).astype(np.float32)
+        return deviations
+
+
+class FFTEngine:
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_frames=2):
+        """
+        TM_CCOEFF_NORMED computed in the frequency domain, a drop-in for cv2.matchTemplate.
+
+        The numerator is the correlation of the frame with the zero-mean template: one multiply of
+        the frame spectrum with the template spectrum and an inverse DFT. The denominator comes from
+        the integral images of the frame. Frame spectra are shared by all templates and template
+        spectra are kept for the next frames of the same size.
+
+        :param max_bytes: Upper bound of the template spectra kept, least recently used ones are dropped first.
+        :param max_frames: Frames whose spectra are kept, the pyramid fallback reuses the last one.
+        """
+        self.max_bytes = max_bytes
+        self.max_frames = max_frames
+        self.current_bytes = 0
+        self._frames = OrderedDict()  # id(image) -> FFTFrame, the frame keeps the image alive
+        self._spectra = OrderedDict()  # (template key, dft shape) -> (spectrum, norm of the zero-mean template)
+        self._lock = threading.Lock()
+
+    def frame(self, image):
+        """Return the FFTFrame of an image, computed once however many templates ask for it."""
+        with self._lock:
+            frame = self._frames.get(id(image))
+            if frame is not None and frame.image is image:
+                self._frames.move_to_end(id(image))
+                return frame
+
+            # Built under the lock, the workers asking for the same frame wait instead of repeating the DFT
+            frame = FFTFrame(image)
+            self._frames[id(image)] = frame
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+            return frame
+
+    def template_spectrum(self, template, dft_shape, key=None):
+        """Return (spectrum, norm) of the zero-mean template padded to dft_shape, cached under key if given."""
+        cache_key = (key, dft_shape)
+        if key is not None:
+            with self._lock:
+                cached = self._spectra.get(cache_key)
+                if cached is not None:
+                    self._spectra.move_to_end(cache_key)
+                    return cached
+
+        h, w = template.shape[:2]
+        zero_mean = template.astype(np.float64) - template.mean()
+        padded = np.zeros(dft_shape, dtype=np.float32)
+        padded[:h, :w] = zero_mean
+        cached = (cv2.dft(padded), float(np.sqrt((zero_mean ** 2).sum())))
+
+        if key is not None:
+            with self._lock:
+                if cache_key not in self._spectra:
+                    self._spectra[cache_key] = cached
+                    self.current_bytes += cached[0].nbytes
+                while self.current_bytes > self.max_bytes and len(self._spectra) > 1:
+                    _, (spectrum, _) = self._spectra.popitem(last=False)
+                    self.current_bytes -= spectrum.nbytes
+        return cached
+
+    def match_template(self, image, template, key=None):
+        """
+        Return the TM_CCOEFF_NORMED map of template over image, as cv2.matchTemplate does.
+
+        key identifies the template (e.g. (path, scale)) so its spectrum is computed only once per frame size.
+        """
+        frame = self.frame(image)
+        h, w = template.shape[:2]
+        height, width = image.shape[:2]
+        spectrum, template_norm = self.template_spectrum(template, frame.dft_shape, key)
+        if template_norm == 0:
+            return np.ones((height - h + 1, width - w + 1), dtype=np.float32)  # OpenCV scores a flat template 1 everywhere
+
+        product = cv2.mulSpectrums(frame.spectrum, spectrum, 0, conjB=True)
+        numerator = cv2.idft(product, flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)[:height - h + 1, :width - w + 1]
+
+        denominator = frame.window_deviations(h, w) * np.float32(template_norm)
+
+        # Same guards as OpenCV: scores are clipped to [-1, 1], scores far outside and flat windows give 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result = numerator / denominator
+        result[~(np.abs(result) < 1.125)] = 0
+        return np.clip(result, -1, 1, out=result)
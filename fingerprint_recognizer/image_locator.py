@@ -1,24 +1,92 @@
-import pyautogui
 import cv2
 import numpy as np
 import os
-from skimage.metrics import structural_similarity as ssim
+import threading
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter, OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .capture import create_capture
+from .descriptors import DescriptorIndex
+from .fft_matching import FFTEngine
+from .nms import non_max_suppression, suppress_matches
+from .similarity import ssim_map
+from .template_store import template_scales
+from .utils.metrics import metrics
 
 
 class ImageLocator:
-    def __init__(self, scale_range=(0.2, 2.1), scale_step=0.5, threshold=0.75):
-        """Initialize the ImageLocator with template paths, scale range, step, and threshold."""
+    def __init__(self, scale_range=(0.2, 2.1), scale_step=0.5, threshold=0.75, template_store=None,
+                 pyramid_levels=0, pyramid_fallback=False, capture=None, capture_region=None, calibration=None,
+                 max_workers=None, match_engine="direct"):
+        """
+        Initialize the ImageLocator with template paths, scale range, step, and threshold.
+
+        pyramid_levels > 0 enables the coarse-to-fine search: candidates are found on a screenshot
+        downsampled by 2 ** pyramid_levels and confirmed at full resolution around the peaks only.
+        With pyramid_fallback a template that gives no hit that way is searched exhaustively again.
+        capture is a ScreenCapture backend (created on first use if omitted) and capture_region an
+        optional (x, y, width, height) the screenshots are limited to. calibration is an optional
+        ScaleCalibration used by locate_calibrated(). max_workers sizes the persistent worker pool
+        (one per core if omitted). match_engine selects how full-frame correlations are computed:
+        "direct" runs cv2.matchTemplate per template, "fft" shares the frame spectrum between all
+        templates (see FFTEngine), which pays off for large templates and frames.
+        """
         
         self.template_paths : list
         self.scale_range = scale_range
         self.scale_step = scale_step
         self.threshold = threshold
         self.templates = []
+        self.overlap_threshold = 0.2  # IoU above which two boxes are considered the same match
+        self.template_store = template_store  # Optional TemplateStore with pre-scaled templates
+
+        self.pyramid_levels = pyramid_levels
+        self.pyramid_fallback = pyramid_fallback
+        self.pyramid_coarse_ratio = 0.6  # Coarse candidates need threshold * ratio
+        self.pyramid_max_candidates = 32  # Peaks confirmed at full resolution per template and scale
+        self.pyramid_min_size = 8  # Smallest downsampled template side still worth matching
+
+        self.capture = capture
+        self.capture_region = capture_region
+        self.last_capture_origin = (0, 0)  # Screen position of the top-left pixel of the last screenshot
+        self.screen_size = None  # (height, width) of the last full-screen capture
+        self.calibration = calibration
+        self.acquire_every = 10  # Misses between two scale acquisitions, see locate_calibrated()
+        self.misses = 0  # Consecutive locate_calibrated() searches that found nothing
+
+        self.max_workers = max_workers or os.cpu_count() or 4
+        self.min_tile_rows = 64  # Exhaustive matching is not split into tiles smaller than this
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        if match_engine not in ("direct", "fft"):
+            raise ValueError(f"Unknown match engine {match_engine!r}, expected 'direct' or 'fft'.")
+        self.match_engine = match_engine
+        self._fft_engine = None
+        # With only_once, a match scoring at least this cancels the (template, scale) pairs not started yet
+        self.early_exit_score = 0.9
+        self.hit_counts = Counter()  # (template path, scale) -> times it gave the best first-hit match
+
+        self.descriptors = DescriptorIndex()  # Thumbnails of every template loaded so far, see rank_slots()
+
+        # Data derived from the shared template entries, kept here so the store's byte count stays right
+        self.max_derived_bytes = 64 * 1024 * 1024
+        self.derived_bytes = 0
+        self._derived = OrderedDict()  # key -> (value, bytes), least recently used first
+        self._derived_lock = threading.Lock()
+
+        self._orb = cv2.ORB_create(nfeatures=5000, scaleFactor=1.2, nlevels=10)
+        self._orb_lock = threading.Lock()
+        self._orb_index = None  # (template paths, FLANN matcher, template indices)
 
     def load_templates(self, template_paths):
         """Load and process templates from file paths."""
+        if self.template_store is not None:
+            # Served from memory, the store already holds the blurred and resized variants
+            self.templates = self.template_store.get_many(template_paths)
+            self.descriptors.add(self.templates)
+            return
+
         self.templates = []
         for path in template_paths:
             if not os.path.exists(path):
@@ -35,12 +103,65 @@ class ImageLocator:
                 'image': template,
                 'grayscale': cv2.cvtColor(template, cv2.COLOR_BGRA2GRAY) if template.shape[-1] == 4 else cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
             })
-
-    def take_screenshot(self):
-        """Capture a screenshot of the current screen."""
-        screenshot = pyautogui.screenshot()
-        screenshot_np = np.array(screenshot)
-        return cv2.cvtColor(screenshot_np, cv2.COLOR_RGB2BGR)
+        self.descriptors.add(self.templates)
+
+    def take_screenshot(self, region=None, grayscale=False):
+        """
+        Capture a screenshot of the current screen, or of region / capture_region when set.
+
+        The returned frame is the reusable buffer of the capture backend.
+        """
+        if self.capture is None:
+            self.capture = create_capture()
+
+        region = region if region is not None else self.capture_region
+        with metrics.timer("capture", region=region):
+            screenshot = self.capture.grab(region=region, grayscale=grayscale)
+        if region:
+            self.last_capture_origin = (region[0], region[1])
+        else:
+            self.last_capture_origin = (0, 0)
+            self.screen_size = screenshot.shape[:2]
+        return screenshot
+
+    def learn_capture_region(self, boxes, margin=0.25):
+        """
+        Limit later screenshots to the bounding box of the given (x, y, width, height) boxes plus a margin.
+
+        A region that still holds every box is kept, so frames of the same keypad stay comparable.
+        """
+        if not boxes:
+            return
+        if self.capture_region is not None:
+            rx, ry, rw, rh = self.capture_region
+            if all(rx <= x and ry <= y and x + w <= rx + rw and y + h <= ry + rh for x, y, w, h in boxes):
+                return
+
+        x0 = min(box[0] for box in boxes)
+        y0 = min(box[1] for box in boxes)
+        x1 = max(box[0] + box[2] for box in boxes)
+        y1 = max(box[1] + box[3] for box in boxes)
+        pad_x = int((x1 - x0) * margin)
+        pad_y = int((y1 - y0) * margin)
+
+        x0, y0 = max(0, x0 - pad_x), max(0, y0 - pad_y)
+        x1, y1 = x1 + pad_x, y1 + pad_y
+        if self.screen_size is not None:
+            x1 = min(x1, self.screen_size[1])
+            y1 = min(y1, self.screen_size[0])
+        self.capture_region = (x0, y0, x1 - x0, y1 - y0)
+        if self.calibration is not None:
+            self.calibration.set_region(self.resolution(), self.capture_region)
+
+    def restore_capture_region(self):
+        """Use the keypad region calibrated for the current resolution, if there is one."""
+        if self.calibration is None or not self.calibration.entries:
+            return False  # Nothing calibrated, the screen size is not needed
+        entry = self.calibration.get(self.resolution())
+        if not entry or 'region' not in entry:
+            return False
+        self.capture_region = tuple(entry['region'])
+        return True
 
     def preprocess_image(self, image):
         """Preprocess the image by reducing noise and enhancing details."""
@@ -48,132 +169,615 @@ class ImageLocator:
         blurred_image = cv2.GaussianBlur(image, (5, 5), 0)
         return blurred_image
 
-    def locate_images_on_screen(self, screenshot, only_once=False):
-        """Locate images on the screen using template matching with multithreading."""
-        matches = []
-        screenshot_gray = cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY)
-        screenshot_gray = self.preprocess_image(screenshot_gray)
-        
-        # Create a set to track which templates have already been processed if 'only_once' is set
-        did_append = set()
-
-        # This will hold the futures for asynchronous tasks
-        future_to_template = {}
-
-        # Function to process each template
-        def process_template(template_data, index):
-            nonlocal matches  # Access the matches list
-            if only_once and index in did_append:
-                return []  # No need to process this template if it was already processed
-
-            template_gray = template_data['grayscale']
-            template_gray = self.preprocess_image(template_gray)
-
-            local_matches = []  # Local matches for this template
-
-            for scale in np.arange(self.scale_range[0], self.scale_range[1], self.scale_step):
-                scaled_template = cv2.resize(template_gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
-                if scaled_template.shape[0] > screenshot_gray.shape[0] or scaled_template.shape[1] > screenshot_gray.shape[1]:
-                    continue  # Skip if the scaled template is larger
-
-                result = cv2.matchTemplate(screenshot_gray, scaled_template, cv2.TM_CCOEFF_NORMED)
-                locations = np.where(result >= self.threshold)
-                h, w = scaled_template.shape[:2]
+    def locate_images_on_screen(self, screenshot, only_once=False, origin=(0, 0), scales=None, fallback=True):
+        """
+        Locate images on the screen using template matching with multithreading.
+
+        screenshot may be BGR or already grayscale, origin is added to the returned coordinates
+        (pass last_capture_origin for region captures). scales overrides the configured sweep,
+        e.g. with the band returned by ScaleCalibration.scales(). only_once switches to the first-hit
+        mode: the (template, scale) pairs are tried in the order of how often they matched before, the
+        rest is cancelled once a match scores at least early_exit_score (see match_candidates()), and
+        only the best scoring match is returned. fallback=False skips the exhaustive pyramid fallback.
+        """
+        screenshot_gray, screenshot_pyramid = self.prepare_screenshot(screenshot)
+        candidates = self.match_candidates(screenshot_gray, screenshot_pyramid, scales, first_hit=only_once, fallback=fallback)
+        matches = self.suppress_candidates(candidates, self.templates, origin)
+        if only_once and matches:
+            self.record_hit(matches[0])
+            return matches[:1]
+        return matches
 
-                for pt in zip(*locations[::-1]):
-                    new_match = {
+    def prepare_screenshot(self, screenshot):
+        """Return the blurred grayscale screenshot and its pyramid."""
+        with metrics.timer("preprocess"):
+            screenshot_gray = screenshot if screenshot.ndim == 2 else cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY)
+            screenshot_gray = self.preprocess_image(screenshot_gray)
+            return screenshot_gray, self.build_pyramid(screenshot_gray)
+
+    def match_candidates(self, screenshot_gray, screenshot_pyramid, scales=None, first_hit=False, fallback=True):
+        """
+        Match the loaded templates and return the raw candidates per template index, see run_units().
+
+        With first_hit the units are ranked by hit_counts and the search stops at the first candidate
+        scoring early_exit_score, the exhaustive fallback only runs if nothing was found at all.
+        fallback=False skips the exhaustive fallback even when pyramid_fallback is set.
+        """
+        indices = range(len(self.templates))
+        stop_score = self.early_exit_score if first_hit else None
+        candidates = self.run_units(self.work_units(indices, screenshot_gray, screenshot_pyramid, scales, first_hit), stop_score)
+
+        # The exhaustive pass only runs as a fallback for templates the pyramid pass found nothing for
+        if self.pyramid_levels and self.pyramid_fallback and fallback and not (first_hit and candidates):
+            missing = [index for index in indices if index not in candidates]
+            if missing:
+                candidates.update(self.run_units(self.work_units(missing, screenshot_gray, None, scales, first_hit), stop_score))
+        return candidates
+
+    def record_hit(self, match):
+        """Count a first-hit match so its template and scale are tried first next time."""
+        self.hit_counts[(match['path'], match['scale'])] += 1
+
+    def suppress_candidates(self, candidates, templates, origin=(0, 0)):
+        """Turn raw candidates into match dicts, keeping the best box of each cluster."""
+        with metrics.timer("nms"):
+            matches = []
+            for index in sorted(candidates):
+                template_data = templates[index]
+
+                # One suppression pass over every scale and tile keeps the best box of each cluster
+                boxes = np.concatenate([found[0] for found in candidates[index]])
+                scores = np.concatenate([found[1] for found in candidates[index]])
+                match_scales = np.concatenate([found[2] for found in candidates[index]])
+                for i in non_max_suppression(boxes, scores, self.overlap_threshold):
+                    matches.append({
                         'index': index,
                         'path': template_data['path'],
-                        'x': int(pt[0]),
-                        'y': int(pt[1]),
-                        'width': int(w),
-                        'height': int(h)
-                    }
-
-                    if not self.is_overlapping(matches, new_match):
-                        local_matches.append(new_match)
-
-            return local_matches
-
-        # Use ThreadPoolExecutor to process templates in parallel
-        with ThreadPoolExecutor(max_workers=4) as executor:  # Adjust max_workers for your hardware
-            for index, template_data in enumerate(self.templates):
-                future = executor.submit(process_template, template_data, index)
-                future_to_template[future] = template_data
-
-            # Collect results as they are completed
-            for future in as_completed(future_to_template):
-                result = future.result()
-                matches.extend(result)  # Add the matches found by this future
+                        'x': int(boxes[i, 0]) + origin[0],
+                        'y': int(boxes[i, 1]) + origin[1],
+                        'width': int(boxes[i, 2]),
+                        'height': int(boxes[i, 3]),
+                        'score': float(scores[i]),
+                        'scale': float(match_scales[i])
+                    })
+
+            # Different templates may still claim the same spot, keep the best scoring one
+            return suppress_matches(matches, self.overlap_threshold)
+
+    def executor(self):
+        """Return the long-lived worker pool, created on first use."""
+        with self._executor_lock:
+            if self._executor is None:
+                # cv2.matchTemplate releases the GIL, threads share the screenshot without copying it
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="matcher")
+            return self._executor
+
+    def derived(self, key, build, size=lambda value: value.nbytes):
+        """Return build() cached under key, dropping the least recently used values beyond max_derived_bytes."""
+        with self._derived_lock:
+            if key in self._derived:
+                self._derived.move_to_end(key)
+                return self._derived[key][0]
+
+        value = build()
+        with self._derived_lock:
+            if key not in self._derived:
+                self._derived[key] = (value, size(value))
+                self.derived_bytes += self._derived[key][1]
+                while self.derived_bytes > self.max_derived_bytes and len(self._derived) > 1:
+                    _, (_, nbytes) = self._derived.popitem(last=False)
+                    self.derived_bytes -= nbytes
+            return self._derived.get(key, (value,))[0]
+
+    def fft_engine(self):
+        """Return the FFTEngine, created on first use."""
+        with self._executor_lock:
+            if self._fft_engine is None:
+                self._fft_engine = FFTEngine()
+            return self._fft_engine
+
+    def close(self):
+        """Shut the worker pool down, it is recreated if the locator is used again."""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def work_units(self, indices, screenshot_gray, screenshot_pyramid, scales=None, ranked=False):
+        """
+        Split the search into (template, scale, tile) units.
+
+        Pyramid units are small already. Exhaustive units are cut into horizontal tiles so that
+        there are at least two units per worker, except with the fft engine, which correlates the
+        whole frame at once. With ranked the units of the (template, scale)
+        pairs that matched most often come first.
+        """
+        units = []
+        exhaustive = []
+        for index in indices:
+            for scale, scaled_template in self.scaled_templates(self.templates[index], scales):
+                if scaled_template.shape[0] > screenshot_gray.shape[0] or scaled_template.shape[1] > screenshot_gray.shape[1]:
+                    continue  # Skip if the scaled template is larger
+                metrics.count("scales_tried")
+
+                if screenshot_pyramid is not None and len(screenshot_pyramid) > 1:
+                    units.append((index, scale, scaled_template, screenshot_gray, screenshot_pyramid, None))
+                else:
+                    exhaustive.append((index, scale, scaled_template))
+
+        if exhaustive:
+            tiles = max(1, -(-2 * self.max_workers // len(exhaustive)))
+            for index, scale, scaled_template in exhaustive:
+                result_rows = screenshot_gray.shape[0] - scaled_template.shape[0] + 1
+                count = 1 if self.match_engine == "fft" else max(1, min(tiles, result_rows // self.min_tile_rows))
+                bounds = np.linspace(0, result_rows, count + 1).astype(int)
+                for r0, r1 in zip(bounds[:-1], bounds[1:]):
+                    units.append((index, scale, scaled_template, screenshot_gray, None, (int(r0), int(r1))))
+
+        if ranked:
+            # Stable sort, tiles of the same pair stay together and untried pairs keep the sweep order
+            units.sort(key=lambda unit: -self.hit_counts[(self.templates[unit[0]]['path'], unit[1])])
+        return units
+
+    def run_units(self, units, stop_score=None):
+        """
+        Match the units on the worker pool and return {template index: [(boxes, scores, scales), ...]}.
+
+        With stop_score the units that have not started yet are cancelled as soon as one candidate
+        scores at least stop_score. Units already running are left to finish but not waited for.
+        """
+        executor = self.executor()
+        futures = {}
+        for index, scale, template, screenshot_gray, screenshot_pyramid, rows in units:
+            future = executor.submit(self.match_unit, index, scale, template, screenshot_gray, screenshot_pyramid, rows)
+            futures[future] = (index, scale, template.shape[:2])
+
+        candidates = {}
+        pending = list(futures)
+        while pending:
+            if stop_score is None:
+                done, pending = pending[:1], pending[1:]  # Submission order keeps the output deterministic
+            else:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                done = [future for future in futures if future in done]
+
+            stop = False
+            for future in done:
+                index, scale, (h, w) = futures[future]
+                xs, ys, scores = future.result()
+                metrics.count("candidate_points", len(xs))
+                if len(xs) == 0:
+                    continue
+
+                boxes = np.empty((len(xs), 4), dtype=np.int64)
+                boxes[:, 0] = xs
+                boxes[:, 1] = ys
+                boxes[:, 2] = w
+                boxes[:, 3] = h
+                candidates.setdefault(index, []).append((boxes, scores, np.full(len(xs), scale)))
+                stop = stop or (stop_score is not None and scores.max() >= stop_score)
+
+            if stop:
+                cancelled = sum(future.cancel() for future in pending)
+                metrics.count("units_cancelled", cancelled)
+                break
+
+        return candidates
+
+    def calibrated_scales(self, band=None):
+        """Return the fine scale band around the calibrated scale of this resolution, or None."""
+        if self.calibration is None:
+            return None
+        return self.calibration.scales(self.resolution(), band)
+
+    def locate_calibrated(self, screenshot, only_once=False, origin=(0, 0), band=None, calibrate=True, acquire=True):
+        """
+        Locate images in the calibrated scale band, falling back to the full sweep.
+
+        The full sweep runs when there is no calibration yet, the band gives no match or, with calibrate,
+        the best band match scores below calibration.min_score. With calibrate the scale of the best
+        match is stored for the next call. A frame the print is not found in keeps the calibration, and
+        a weak band match nothing else beats is returned as it is.
+
+        When the sweep finds nothing either, the scale may fall between two of its steps. With acquire
+        the candidates of acquire_scales() are then confirmed in their bands. That costs several sweeps,
+        so it only runs on the first miss and then every acquire_every misses in a row, and callers
+        searching a region before the full screen pass acquire=False for the region. The exhaustive
+        pyramid fallback of the band search only covers the calibrated scale, not the whole band.
+        """
+        scales = self.calibrated_scales(band)
+        band_matches = []
+        if scales is not None:
+            band_matches = self.locate_images_on_screen(screenshot, only_once, origin, scales, fallback=False)
+            if not band_matches and self.pyramid_levels and self.pyramid_fallback:
+                # The pyramid pass loses small prints, search the calibrated scale itself exhaustively
+                scale = self.calibration.get(self.resolution())['scale']
+                band_matches = self.locate_images_on_screen(screenshot, only_once, origin, [scale])
+            if band_matches and (not calibrate or band_matches[0]['score'] >= self.calibration.min_score):
+                self.misses = 0
+                if calibrate:
+                    self.calibration.update(self.resolution(), band_matches[0]['scale'], band_matches[0]['score'])
+                return band_matches
+
+        # Confidence dropped (UI scale or resolution changed) or the print is not on screen, search every scale
+        matches = self.locate_images_on_screen(screenshot, only_once, origin)
+        if not matches and not band_matches and acquire and calibrate and self.calibration is not None:
+            self.misses += 1
+            if (self.misses - 1) % self.acquire_every == 0:
+                # The UI scale may fall between two steps of the sweep, where the correlation is too low
+                for scale, box in self.acquire_scales(screenshot):
+                    matches = self.confirm_candidate(screenshot, scale, box, only_once, origin, band)
+                    if matches:
+                        break
+
+        matches = matches or band_matches
+        if matches:
+            self.misses = 0
+        if matches and calibrate and self.calibration is not None:
+            self.calibration.update(self.resolution(), matches[0]['scale'], matches[0]['score'])
+        return matches
 
-                # If 'only_once' is True, mark this template as processed
-                template_data = future_to_template[future]
-                if only_once:
-                    did_append.add(self.templates.index(template_data))
+    def confirm_candidate(self, screenshot, scale, box, only_once=False, origin=(0, 0), band=None):
+        """
+        Search the calibration band around scale in a window around an acquire_scales() box.
+
+        The window leaves room for the largest scale of the band, so it is searched exhaustively at
+        little cost, which the small scales the pyramid pass misses need.
+        """
+        band = self.calibration.band if band is None else band
+        x, y, w, h = box
+        pad = int(max(w, h) * band / scale) + 2 * self.pyramid_min_size
+        x0, y0 = max(0, x - pad), max(0, y - pad)
+        window = screenshot[y0:y + h + 2 * pad, x0:x + w + 2 * pad]
+        return self.locate_images_on_screen(
+            window, only_once, (origin[0] + x0, origin[1] + y0), self.calibration.band_scales(scale, band)
+        )
+
+    def acquire_scales(self, screenshot, step=None, count=3):
+        """
+        Return up to count (scale, (x, y, width, height)) candidates of the loaded templates, most likely first.
+
+        Every scale of scale_range is tried step apart (the calibration band by default, so the band
+        around the right candidate holds the true scale) on the screenshot at half resolution, where
+        the correlation falls off slower with the scale error. Peaks below the relaxed pyramid
+        threshold are ignored, the others are ranked by how far they stand out of their correlation
+        map, as small templates reach high scores on noise too. The box is the one of the peak in
+        screenshot pixels, the caller confirms the candidates around it at full resolution.
+        """
+        step = step or self.calibration.band
+        screenshot_gray, _ = self.prepare_screenshot(screenshot)
+        coarse_screen = cv2.pyrDown(screenshot_gray)
+
+        def template_candidates(template_data):
+            template_gray = template_data.get('blurred')
+            if template_gray is None:
+                template_gray = self.preprocess_image(template_data['grayscale'])
+            found = []
+            for scale in template_scales(self.scale_range, step):
+                size = (round(template_gray.shape[1] * scale / 2), round(template_gray.shape[0] * scale / 2))
+                if min(size) < self.pyramid_min_size or size[0] > coarse_screen.shape[1] or size[1] > coarse_screen.shape[0]:
+                    continue
+                coarse_template = cv2.resize(template_gray, size, interpolation=cv2.INTER_AREA)
+                result = cv2.matchTemplate(coarse_screen, coarse_template, cv2.TM_CCOEFF_NORMED)
+                _, peak, _, (x, y) = cv2.minMaxLoc(result)
+                if peak >= self.threshold * self.pyramid_coarse_ratio:
+                    mean, deviation = cv2.meanStdDev(result)
+                    box = (2 * x, 2 * y, round(template_gray.shape[1] * scale), round(template_gray.shape[0] * scale))
+                    found.append(((peak - mean[0, 0]) / max(deviation[0, 0], 1e-6), scale, box))
+            return found
+
+        with metrics.timer("acquire_scales", templates=len(self.templates)):
+            futures = [self.executor().submit(template_candidates, template_data) for template_data in self.templates]
+            found = sorted((candidate for future in futures for candidate in future.result()), key=lambda c: -c[0])
+
+        candidates = {}
+        for _, scale, box in found:
+            candidates.setdefault(scale, box)  # The best peak of each scale
+        return list(candidates.items())[:count]
+
+    def rank_slots(self, screenshot, slot_boxes, origin=(0, 0), top_k=2, min_similarity=0.5):
+        """
+        Return, for each (x, y, width, height) slot box, the indices of the top_k loaded templates it looks most like.
+
+        The crops are compared with the template descriptors in a single matrix multiply, see DescriptorIndex.
+        Templates less similar than min_similarity are left out, so a slot without a fragment gets none.
+        """
+        screenshot_gray = screenshot if screenshot.ndim == 2 else cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY)
+        crops, slots = [], []
+        for slot, (x, y, w, h) in enumerate(slot_boxes):
+            crop = screenshot_gray[max(0, y - origin[1]):max(0, y - origin[1] + h), max(0, x - origin[0]):max(0, x - origin[0] + w)]
+            if crop.size:
+                crops.append(self.preprocess_image(crop))
+                slots.append(slot)
+
+        ranked = [[] for _ in slot_boxes]
+        with metrics.timer("rank_slots", slots=len(crops), templates=len(self.templates)):
+            scores = self.descriptors.similarities(crops, [template_data['path'] for template_data in self.templates])
+        for slot, row in zip(slots, scores):
+            ranked[slot] = [int(index) for index in np.argsort(-row, kind="stable")[:top_k] if row[index] >= min_similarity]
+        return ranked
+
+    def match_slots(self, screenshot, slot_rects, scales, origin=(0, 0), shortlist=None):
+        """
+        Score every loaded template in every slot window and return the matches of the best pairs.
+
+        slot_rects are (x, y, width, height) screen windows (see KeypadLayout.slot_rects()) and scales
+        the template scales to try, normally the one of the main print. Each slot is a single unit on
+        the worker pool correlating all templates in it, or only the template indices of its shortlist
+        entry (see rank_slots()). A slot holds at most one template and a template sits in at most one
+        slot, pairs are assigned best score first.
+        """
+        screenshot_gray = screenshot if screenshot.ndim == 2 else cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY)
+        screen_h, screen_w = screenshot_gray.shape[:2]
+        scaled = [list(self.scaled_templates(template_data, scales)) for template_data in self.templates]
+
+        def score_slot(rect, indices):
+            x0, y0 = max(0, rect[0] - origin[0]), max(0, rect[1] - origin[1])
+            x1, y1 = min(screen_w, rect[0] - origin[0] + rect[2]), min(screen_h, rect[1] - origin[1] + rect[3])
+            if x1 <= x0 or y1 <= y0 or not len(indices):
+                return []
+            crop = self.preprocess_image(screenshot_gray[y0:y1, x0:x1])
+
+            pairs = []
+            for index in indices:
+                best = None
+                for scale, template in scaled[index]:
+                    if template.shape[0] > crop.shape[0] or template.shape[1] > crop.shape[1]:
+                        continue
+                    _, score, _, (x, y) = cv2.minMaxLoc(cv2.matchTemplate(crop, template, cv2.TM_CCOEFF_NORMED))
+                    if best is None or score > best[0]:
+                        best = (score, index, x + x0, y + y0, template.shape[1], template.shape[0], scale)
+                if best is not None and best[0] >= self.threshold:
+                    pairs.append(best)
+            return pairs
+
+        with metrics.timer("slots", slots=len(slot_rects), templates=len(self.templates)):
+            futures = [
+                self.executor().submit(score_slot, rect, range(len(self.templates)) if shortlist is None else shortlist[slot])
+                for slot, rect in enumerate(slot_rects)
+            ]
+            pairs = [(pair, slot) for slot, future in enumerate(futures) for pair in future.result()]
 
+        matches = []
+        used_slots, used_templates = set(), set()
+        for (score, index, x, y, w, h, scale), slot in sorted(pairs, key=lambda item: -item[0][0]):
+            if slot in used_slots or index in used_templates:
+                continue
+            used_slots.add(slot)
+            used_templates.add(index)
+            matches.append({
+                'index': index,
+                'path': self.templates[index]['path'],
+                'x': int(x) + origin[0],
+                'y': int(y) + origin[1],
+                'width': int(w),
+                'height': int(h),
+                'score': float(score),
+                'scale': float(scale)
+            })
         return matches
 
+    def build_pyramid(self, image):
+        """Return [image, image / 2, image / 4, ...] down to the configured pyramid depth."""
+        pyramid = [image]
+        for _ in range(self.pyramid_levels):
+            pyramid.append(cv2.pyrDown(pyramid[-1]))
+        return pyramid
+
+    def match_unit(self, index, scale, template, screenshot_gray, screenshot_pyramid, rows):
+        """Run match_template for one work unit, timed per template."""
+        path = self.templates[index]['path']
+        with metrics.timer("match", template=path, scale=scale, rows=rows, engine=self.match_engine):
+            return self.match_template(screenshot_gray, template, screenshot_pyramid, rows, key=(path, scale))
+
+    def match_template(self, screenshot_gray, template, screenshot_pyramid=None, rows=None, key=None):
+        """
+        Return (xs, ys, scores) of the positions where the template scores at least the threshold.
+
+        Without a pyramid (or when the template gets too small to downsample) the whole screenshot
+        is correlated, or only the result rows [rows[0], rows[1]) of it. Otherwise only small
+        regions around the coarse peaks are. key identifies the template for the fft engine's
+        spectrum cache.
+        """
+        levels = len(screenshot_pyramid) - 1 if screenshot_pyramid else 0
+        coarse_template = template
+        for _ in range(levels):
+            coarse_template = cv2.pyrDown(coarse_template)
+
+        if levels == 0 or min(coarse_template.shape[:2]) < self.pyramid_min_size:
+            r0, r1 = rows if rows is not None else (0, screenshot_gray.shape[0] - template.shape[0] + 1)
+            if self.match_engine == "fft":
+                result = self.fft_engine().match_template(screenshot_gray, template, key)[r0:r1]
+            else:
+                image = screenshot_gray[r0:r1 + template.shape[0] - 1]
+                result = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+            ys, xs = np.where(result >= self.threshold)
+            return xs, ys + r0, result[ys, xs]
+
+        coarse_screen = screenshot_pyramid[levels]
+        if coarse_template.shape[0] > coarse_screen.shape[0] or coarse_template.shape[1] > coarse_screen.shape[1]:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+
+        # Local maxima of the coarse map above the relaxed threshold
+        coarse = cv2.matchTemplate(coarse_screen, coarse_template, cv2.TM_CCOEFF_NORMED)
+        peaks = (coarse == cv2.dilate(coarse, np.ones((3, 3), np.uint8))) & (coarse >= self.threshold * self.pyramid_coarse_ratio)
+        peak_ys, peak_xs = np.nonzero(peaks)
+        order = np.argsort(coarse[peak_ys, peak_xs])[::-1][:self.pyramid_max_candidates]
+
+        factor = 2 ** levels
+        pad = 2 * factor
+        h, w = template.shape[:2]
+        screen_h, screen_w = screenshot_gray.shape[:2]
+        hits = {}
+        for i in order:
+            x0 = max(0, peak_xs[i] * factor - pad)
+            y0 = max(0, peak_ys[i] * factor - pad)
+            x1 = min(screen_w, peak_xs[i] * factor + w + pad)
+            y1 = min(screen_h, peak_ys[i] * factor + h + pad)
+            if x1 - x0 < w or y1 - y0 < h:
+                continue
 
-    def is_overlapping(self, matches, new_match, overlap_threshold=0.2):
-        """Check if the new match overlaps significantly with any existing match."""
-        for match in matches:
-            x1, y1, w1, h1 = match['x'], match['y'], match['width'], match['height']
-            x2, y2, w2, h2 = new_match['x'], new_match['y'], new_match['width'], new_match['height']
-
-            x_intersection = max(x1, x2)
-            y_intersection = max(y1, y2)
-            w_intersection = min(x1 + w1, x2 + w2) - x_intersection
-            h_intersection = min(y1 + h1, y2 + h2) - y_intersection
+            result = cv2.matchTemplate(screenshot_gray[y0:y1, x0:x1], template, cv2.TM_CCOEFF_NORMED)
+            ys, xs = np.where(result >= self.threshold)
+            for x, y, score in zip(xs + x0, ys + y0, result[ys, xs]):
+                hits[(x, y)] = score  # Neighbouring regions overlap, keep each position once
+
+        if not hits:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+
+        positions = sorted(hits)
+        xs = np.array([x for x, _ in positions], dtype=np.intp)
+        ys = np.array([y for _, y in positions], dtype=np.intp)
+        return xs, ys, np.array([hits[p] for p in positions], dtype=np.float32)
+
+    def scaled_templates(self, template_data, scales=None):
+        """
+        Yield (scale, blurred grayscale template) pairs for the configured scale range or the given scales.
+
+        Scales that were not precomputed are resized once and kept in the bounded derived() cache.
+        """
+        precomputed = dict(template_data.get('scaled', ()))
+        if scales is None:
+            scales = template_scales(self.scale_range, self.scale_step)
+
+        def resize(scale):
+            template_gray = template_data.get('blurred')
+            if template_gray is None:
+                template_gray = self.preprocess_image(template_data['grayscale'])
+            return cv2.resize(template_gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+
+        for scale in scales:
+            scaled = precomputed.get(scale)
+            if scaled is None:
+                scaled = self.derived(("scaled", template_data['path'], scale), lambda: resize(scale))
+            yield scale, scaled
+
+    def resolution(self):
+        """Return the (height, width) of the full screen, from the last full capture or the backend."""
+        if self.screen_size is None:
+            if self.capture is None:
+                self.capture = create_capture()
+            self.screen_size = self.capture.screen_size()
+        return self.screen_size
+
+    def orb_features(self, image):
+        """Return the ORB keypoint positions (n, 2) and descriptors of a grayscale image."""
+        with self._orb_lock:  # A cv2.ORB instance must not be used by two threads at once
+            keypoints, descriptors = self._orb.detectAndCompute(image, None)
+        points = np.array([kp.pt for kp in keypoints], dtype=np.float32).reshape(-1, 2)
+        return points, descriptors
+
+    def template_orb_features(self, template_data):
+        """Return the ORB features of a template, computed once and kept in the bounded derived() cache."""
+        return self.derived(
+            ("orb", template_data['path']),
+            lambda: self.orb_features(template_data['grayscale']),
+            size=lambda features: features[0].nbytes + (features[1].nbytes if features[1] is not None else 0),
+        )
+
+    def orb_index(self):
+        """Return (matcher, template indices) of the FLANN LSH index over all template descriptors."""
+        key = tuple(template_data['path'] for template_data in self.templates)
+        if self._orb_index is not None and self._orb_index[0] == key:
+            return self._orb_index[1], self._orb_index[2]
+
+        matcher = cv2.FlannBasedMatcher(
+            dict(algorithm=6, table_number=6, key_size=12, multi_probe_level=1),  # 6 = FLANN_INDEX_LSH
+            dict(checks=50),
+        )
+        indices = []
+        for index, template_data in enumerate(self.templates):
+            _, descriptors = self.template_orb_features(template_data)
+            if descriptors is not None and len(descriptors) >= 2:
+                matcher.add([descriptors])
+                indices.append(index)
+        if indices:
+            matcher.train()
+
+        self._orb_index = (key, matcher, indices)
+        return matcher, indices
+
+    def orb_matching(self, screenshot, ratio=0.75, min_matches=10):
+        """
+        ORB (Oriented FAST and Rotated BRIEF) feature matching with adjusted sensitivity.
+
+        The screenshot features are extracted once and matched against a FLANN LSH index of all
+        template descriptors. Matches passing Lowe's ratio test are grouped per template, and a
+        RANSAC homography projects the template outline to get the box. The score is the inlier ratio.
+        """
+        screenshot_gray = screenshot if screenshot.ndim == 2 else cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY)
+        screen_points, screen_descriptors = self.orb_features(screenshot_gray)
+        matcher, indices = self.orb_index()
+        if screen_descriptors is None or len(screen_descriptors) < 2 or not indices:
+            return []
+
+        good = {}
+        for pair in matcher.knnMatch(screen_descriptors, k=2):
+            if len(pair) == 2 and pair[0].distance < ratio * pair[1].distance:
+                good.setdefault(pair[0].imgIdx, []).append(pair[0])
 
-            if w_intersection > 0 and h_intersection > 0:
-                intersection_area = w_intersection * h_intersection
-                area1 = w1 * h1
-                area2 = w2 * h2
-                overlap = intersection_area / float(area1 + area2 - intersection_area)
+        matches = []
+        for image_index, template_matches in good.items():
+            if len(template_matches) < min_matches:
+                continue
 
-                if overlap > overlap_threshold:
-                    return True
+            template_data = self.templates[indices[image_index]]
+            template_points, _ = self.template_orb_features(template_data)
+            src = template_points[[m.trainIdx for m in template_matches]].reshape(-1, 1, 2)
+            dst = screen_points[[m.queryIdx for m in template_matches]].reshape(-1, 1, 2)
 
-        return False
+            homography, inliers = cv2.findHomography(src, dst, cv2.RANSAC, 5.0)
+            if homography is None or inliers.sum() < min_matches:
+                continue
 
-    def orb_matching(self, screenshot):
-        """ORB (Oriented FAST and Rotated BRIEF) feature matching with adjusted sensitivity."""
-        matches = []
-        orb = cv2.ORB_create(nfeatures=5000, scaleFactor=1.2, nlevels=10)
+            h, w = template_data['grayscale'].shape[:2]
+            corners = np.float32([[0, 0], [w, 0], [w, h], [0, h]]).reshape(-1, 1, 2)
+            x, y, box_w, box_h = cv2.boundingRect(cv2.perspectiveTransform(corners, homography))
+            if not (w * h / 16 <= box_w * box_h <= w * h * 16):
+                continue  # Degenerate homography
+
+            matches.append({
+                'index': indices[image_index],
+                'path': template_data['path'],
+                'x': int(x),
+                'y': int(y),
+                'width': int(box_w),
+                'height': int(box_h),
+                'score': float(inliers.sum()) / len(template_matches),
+            })
 
-        for template_data in self.templates:
-            template = template_data['image']
-            keypoints1, descriptors1 = orb.detectAndCompute(template, None)
-            keypoints2, descriptors2 = orb.detectAndCompute(screenshot, None)
-            
-            bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-            raw_matches = bf.match(descriptors1, descriptors2)
-            raw_matches = sorted(raw_matches, key=lambda x: x.distance)
-            
-            distance_threshold = 75
-            filtered_matches = [match for match in raw_matches if match.distance < distance_threshold]
-            
-            for match in filtered_matches[:20]:
-                kp = keypoints2[match.trainIdx].pt
-                matches.append({'x': int(kp[0]), 'y': int(kp[1]), 'width': 50, 'height': 50, 'score': match.distance})
-        
         return matches
 
-    def ssim_matching(self, screenshot):
-        """SSIM (Structural Similarity Index) matching."""
+    def ssim_matching(self, screenshot, stride=1):
+        """
+        SSIM (Structural Similarity Index) matching.
+
+        The SSIM of every window is computed at once by similarity.ssim_map, stride only thins out
+        the returned positions. Each template keeps the best box of every cluster.
+        """
+        screenshot_gray = screenshot if screenshot.ndim == 2 else cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY)
+
+        def process_template(template_gray):
+            h, w = template_gray.shape[:2]
+            if h > screenshot_gray.shape[0] or w > screenshot_gray.shape[1]:
+                return []
+
+            scores = ssim_map(screenshot_gray, template_gray, stride)
+            ys, xs = np.where(scores >= self.threshold)
+            if len(xs) == 0:
+                return []
+
+            boxes = np.column_stack([xs * stride, ys * stride, np.full(len(xs), w), np.full(len(xs), h)])
+            found = scores[ys, xs]
+            return [
+                {'x': int(boxes[i, 0]), 'y': int(boxes[i, 1]), 'width': w, 'height': h, 'score': float(found[i])}
+                for i in non_max_suppression(boxes, found, self.overlap_threshold)
+            ]
+
+        futures = [self.executor().submit(process_template, template_data['grayscale']) for template_data in self.templates]
         matches = []
-        for template_data in self.templates:
-            template_gray = template_data['grayscale']
-            h, w = template_gray.shape
-            for y in range(0, screenshot.shape[0] - h + 1, 10):
-                for x in range(0, screenshot.shape[1] - w + 1, 10):
-                    patch = screenshot[y:y + h, x:x + w]
-                    patch_resized = cv2.resize(patch, (w, h))
-                    score = ssim(template_gray, patch_resized, multichannel=False)
-
-                    if score >= self.threshold:
-                        matches.append({'x': x, 'y': y, 'width': w, 'height': h, 'score': score})
-
+        for future in futures:
+            matches.extend(future.result())
         return matches
 
     def locate_objects(self, screenshot):
@@ -183,9 +787,4 @@ class ImageLocator:
         ssim_matches = self.ssim_matching(screenshot)
 
         all_matches = template_matches + orb_matches + ssim_matches
-        unique_matches = []
-        for match in all_matches:
-            if not self.is_overlapping(unique_matches, match):
-                unique_matches.append(match)
-
-        return unique_matches
+        return suppress_matches(all_matches, self.overlap_threshold)
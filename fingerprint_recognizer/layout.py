@@ -0,0 +1,66 @@
+from .nms import box_iou
+
+
+class KeypadLayout:
+    def __init__(self, slots=None, margin=0.2, max_slots=8, same_slot_iou=0.5):
+        """
+        Positions of the fragment slots relative to the main print.
+
+        A slot is (dx, dy, width, height) in units of the main print box, so it holds at every UI
+        scale. The slots are learned from full searches: each confirmed fragment box that does not
+        fall into a known slot adds one, up to max_slots (the keypad shows 8 fragments).
+
+        :param slots: Known slots, e.g. from ScaleCalibration.
+        :param margin: Fraction of the slot size searched around it on every side.
+        :param max_slots: Number of slots of the keypad, no more are learned.
+        :param same_slot_iou: IoU above which a fragment box is taken for a known slot.
+        """
+        self.slots = [tuple(float(value) for value in slot) for slot in slots or ()]
+        self.margin = margin
+        self.max_slots = max_slots
+        self.same_slot_iou = same_slot_iou
+
+    def relative(self, main, box):
+        """Return an (x, y, width, height) box in units of the main print match."""
+        return (
+            (box[0] - main['x']) / main['width'],
+            (box[1] - main['y']) / main['height'],
+            box[2] / main['width'],
+            box[3] / main['height'],
+        )
+
+    def slot_rects(self, main, bounds=None, margin=None):
+        """
+        Return the (x, y, width, height) search windows of the slots around a main print match, in slot order.
+
+        bounds is an optional (x, y, width, height) the windows are clipped to, e.g. the screenshot, a
+        window outside of it gets a zero size. margin overrides self.margin, 0 gives the slot boxes.
+        """
+        margin = self.margin if margin is None else margin
+        rects = []
+        for dx, dy, w, h in self.slots:
+            width, height = w * main['width'], h * main['height']
+            x0 = main['x'] + dx * main['width'] - width * margin
+            y0 = main['y'] + dy * main['height'] - height * margin
+            x1 = x0 + width * (1 + 2 * margin)
+            y1 = y0 + height * (1 + 2 * margin)
+            if bounds is not None:
+                x0, y0 = max(x0, bounds[0]), max(y0, bounds[1])
+                x1, y1 = min(x1, bounds[0] + bounds[2]), min(y1, bounds[1] + bounds[3])
+            rects.append((int(x0), int(y0), max(0, int(round(x1 - x0))), max(0, int(round(y1 - y0)))))
+        return rects
+
+    def learn(self, main, boxes):
+        """Add the slots of confirmed fragment boxes around a main print, True if a slot was added."""
+        added = False
+        for box in boxes:
+            slot = self.relative(main, box)
+            if len(self.slots) >= self.max_slots:
+                break
+            if 0 <= slot[0] + slot[2] / 2 <= 1 and 0 <= slot[1] + slot[3] / 2 <= 1:
+                continue  # The fragment matched inside the main print itself, not in a slot
+            if any(box_iou(slot, known) > self.same_slot_iou for known in self.slots):
+                continue
+            self.slots.append(slot)
+            added = True
+        return added
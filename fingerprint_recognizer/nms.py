@@ -0,0 +1,61 @@
+import numpy as np
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, width, height) boxes."""
+    w = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    h = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    if w <= 0 or h <= 0:
+        return 0.0
+    intersection = w * h
+    return intersection / float(a[2] * a[3] + b[2] * b[3] - intersection)
+
+
+def non_max_suppression(boxes, scores, overlap_threshold=0.2):
+    """
+    Greedy non-maximum suppression on array-backed boxes.
+
+    :param boxes: (n, 4) array of (x, y, width, height).
+    :param scores: (n,) array, higher is better.
+    :param overlap_threshold: Boxes whose IoU with a better box exceeds this value are dropped.
+    :return: Indices of the kept boxes, best score first.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.intp)
+
+    x1 = boxes[:, 0]
+    y1 = boxes[:, 1]
+    x2 = x1 + boxes[:, 2]
+    y2 = y1 + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+
+    # Stable sort so equal scores keep their input order
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+
+        w = np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest])
+        h = np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest])
+        intersection = np.clip(w, 0, None) * np.clip(h, 0, None)
+        union = areas[best] + areas[rest] - intersection
+        overlap = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+        # Everything in the cluster of the current best box is dropped in one step
+        order = rest[overlap <= overlap_threshold]
+
+    return np.array(keep, dtype=np.intp)
+
+
+def suppress_matches(matches, overlap_threshold=0.2):
+    """Run non_max_suppression on a list of match dicts, matches without a score count as 0."""
+    if not matches:
+        return []
+
+    boxes = np.array([(m['x'], m['y'], m['width'], m['height']) for m in matches], dtype=np.float64)
+    scores = np.array([m.get('score', 0.0) for m in matches], dtype=np.float64)
+    return [matches[i] for i in non_max_suppression(boxes, scores, overlap_threshold)]
@@ -1,18 +1,36 @@
 import sys
-from PyQt5.QtCore import Qt, QRect, QPoint
-from PyQt5.QtGui import QColor, QPainter, QBrush, QPen, QFont
+from PyQt5.QtCore import Qt, QRect, QPoint, pyqtSignal
+from PyQt5.QtGui import QColor, QPainter, QBrush, QPen, QFont, QFontMetrics, QStaticText, QTransform
 from PyQt5.QtWidgets import QApplication, QMainWindow, QDesktopWidget, QWidget
 
 
 class RectangleOverlay(QWidget):
+    # Emitted by the public setters: applied directly on the overlay's thread, queued from any other
+    _rectangles_changed = pyqtSignal(object)
+    _text_changed = pyqtSignal(object, object)
+
     def __init__(self, rectangles=None, color=(0, 255, 0), thickness=2, text=None, text_position=(0, 0)):
         super().__init__()
-        self.rectangles = rectangles if rectangles else []
+        self.rectangles = [tuple(rect) for rect in rectangles] if rectangles else []  # Hashable, see _apply_rectangles()
         self.color = QColor(*color)
         self.thickness = thickness
         self.text = text  # Text to be displayed
         self.text_position = text_position  # Position to display the text (x, y)
 
+        # Pens, font and text layout are built once, not on every paint
+        self.pen = QPen(self.color)
+        self.pen.setWidth(self.thickness)
+        self.text_pen = QPen(QColor(255, 255, 255))  # White color for text
+        self.text_font = QFont("Arial", 24)  # Set font and size
+        self.text_metrics = QFontMetrics(self.text_font)
+        self._static_text = None
+        self._text_origin = QPoint()
+        self._text_rect = QRect()
+        self._layout_text()
+
+        self._rectangles_changed.connect(self._apply_rectangles)
+        self._text_changed.connect(self._apply_text)
+
         # Set up the overlay window
         self.setWindowFlags(Qt.Window | Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint)
         self.setAttribute(Qt.WA_TranslucentBackground)
@@ -25,45 +43,83 @@ class RectangleOverlay(QWidget):
 
     def set_rectangles(self, rectangles):
         """
-        Update the list of rectangles to be drawn.
+        Update the list of rectangles to be drawn. Safe to call from any thread.
         :param rectangles: List of rectangles [(x, y, width, height), ...]
         """
-        self.rectangles = rectangles
-        self.update()  # Trigger a repaint
+        self._rectangles_changed.emit([tuple(rect) for rect in rectangles])
 
     def display_text(self, text, position=None):
         """
-        Set the text to be displayed on the overlay.
+        Set the text to be displayed on the overlay. Safe to call from any thread.
         :param text: Text to display
         :param position: (x, y) position of the text on the overlay
         """
+        self._text_changed.emit(text, position)
+
+    def _apply_rectangles(self, rectangles):
+        """Store the new rectangles and repaint only the ones that appeared or disappeared."""
+        old, new = set(self.rectangles), set(rectangles)
+        self.rectangles = rectangles
+        for rect in old ^ new:
+            self.update(self._damage_rect(rect))
+
+    def _apply_text(self, text, position):
+        """Store the new text and repaint its old and new area if it changed."""
+        if position is None:
+            position = self.text_position
+        if text == self.text and tuple(position) == tuple(self.text_position):
+            return
+
+        old_rect = self._text_rect
         self.text = text
-        if position is not None:
-            self.text_position = position
-            
-        self.update()  # Trigger a repaint
+        self.text_position = position
+        self._layout_text()
+        if not old_rect.isNull():
+            self.update(old_rect)
+        if not self._text_rect.isNull():
+            self.update(self._text_rect)
+
+    def _damage_rect(self, rect):
+        """Return the area covered by a drawn rectangle, including the pen width."""
+        x, y, width, height = rect
+        margin = self.thickness + 1
+        return QRect(x - margin, y - margin, width + 2 * margin, height + 2 * margin)
+
+    def _layout_text(self):
+        """Lay the text out once and remember the area it covers."""
+        if not self.text:
+            self._static_text = None
+            self._text_rect = QRect()
+            return
+
+        self._static_text = QStaticText(self.text)
+        self._static_text.prepare(QTransform(), self.text_font)
+        # drawText() takes the baseline position, QStaticText the top-left corner
+        x, y = self.text_position
+        self._text_origin = QPoint(x, y - self.text_metrics.ascent())
+        self._text_rect = self.text_metrics.boundingRect(self.text).translated(x, y).adjusted(-2, -2, 2, 2)
 
     def paintEvent(self, event):
         """
-        Draw the rectangles and text on the overlay.
+        Draw the rectangles and text that intersect the repainted area.
         """
         painter = QPainter(self)
         painter.setRenderHint(QPainter.Antialiasing)
+        dirty = event.rect()
 
-        pen = QPen(self.color)
-        pen.setWidth(self.thickness)
-        painter.setPen(pen)
+        painter.setPen(self.pen)
 
         # Draw the rectangles
         for rect in self.rectangles:
-            x, y, width, height = rect
-            painter.drawRect(QRect(x, y, width, height))
+            if self._damage_rect(rect).intersects(dirty):
+                x, y, width, height = rect
+                painter.drawRect(QRect(x, y, width, height))
 
         # Draw the text if specified
-        if self.text:
-            painter.setPen(QPen(QColor(255, 255, 255)))  # White color for text
-            painter.setFont(QFont("Arial", 24))  # Set font and size
-            painter.drawText(QPoint(self.text_position[0], self.text_position[1]), self.text)
+        if self._static_text is not None and self._text_rect.intersects(dirty):
+            painter.setPen(self.text_pen)
+            painter.setFont(self.text_font)
+            painter.drawStaticText(self._text_origin, self._static_text)
 
         painter.end()
 
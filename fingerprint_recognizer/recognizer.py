@@ -1,46 +1,125 @@
 from PyQt5.QtWidgets import QApplication
-from PyQt5.QtCore import QTimer
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+import signal
 import sys
-import keyboard
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from .calibration import DEFAULT_CALIBRATION_PATH, ScaleCalibration
+from .capture import create_capture
 from .image_locator import ImageLocator
+from .layout import KeypadLayout
+from .result_cache import ResultCache, file_signature, perceptual_hash
 from .overlay import RectangleOverlay
+from .template_pack import open_templates
+from .tracker import BoxTracker
 import os
 from .utils.logger import log
+from .utils.metrics import metrics
+
+
+class DetectionSignals(QObject):
+    """Signals emitted from the detection worker, Qt delivers them on the overlay's thread."""
+    status = pyqtSignal(str)
+    finished = pyqtSignal(object)  # (rectangles, text, keypress time)
+    cleared = pyqtSignal()
 
 
 class FingerprintRecognizer:
-    def __init__(self, resources_path="\\resources", threshold=0.75, update_interval=500):
+    def __init__(self, resources_path="\\resources", threshold=0.75, template_cache_dir=None,
+                 pyramid_levels=2, capture_backend="auto", capture_region=None,
+                 calibration_path=DEFAULT_CALIBRATION_PATH, result_cache_size=64, result_cache_path=None):
         """
         Initialize the Fingerprint Recognizer.
         
         :param resources_path: Path to the resources directory.
         :param threshold: Matching threshold for image detection.
-        :param update_interval: Interval for overlay updates (in milliseconds).
+        :param template_cache_dir: Optional directory to persist the precomputed templates between runs.
+        :param pyramid_levels: Depth of the coarse-to-fine search (0 searches the full resolution only).
+        :param capture_backend: Screen capture backend ("auto", "mss" or "pyautogui").
+        :param capture_region: Fixed (x, y, width, height) to capture, learned from the first hit if omitted.
+        :param calibration_path: JSON file keeping the detected scale and region per resolution (None: memory only).
+        :param result_cache_size: Detections kept for near-duplicate frames (0 disables the result cache).
+        :param result_cache_path: Optional JSON file the result cache is persisted to between sessions.
         """
-        self.app = QApplication(sys.argv)
+        self.app = None  # QApplication, overlay and signals are created by init_gui() when first needed
+        self.overlay = None
+        self.signals = None
         self.resources_path = os.path.dirname(__file__)+resources_path
+        self.locator = ImageLocator(
+            threshold=threshold,
+            pyramid_levels=pyramid_levels,
+            pyramid_fallback=True,
+            capture=create_capture(capture_backend),
+            capture_region=capture_region,
+            calibration=ScaleCalibration(calibration_path),
+        )
+        self.learn_capture_region = capture_region is None
+        if self.learn_capture_region and self.locator.restore_capture_region():
+            log(f"Using calibrated capture region: {self.locator.capture_region}", level="info")
+
+        # Decode every template once, or map the prebuilt pack, refreshes only run the matching
+        self.template_store = open_templates(
+            self.resources_path,
+            scale_range=self.locator.scale_range,
+            scale_step=self.locator.scale_step,
+            cache_dir=template_cache_dir,
+        )
+        self.locator.template_store = self.template_store
         self.template_paths = self._get_main_templates()
-        self.locator = ImageLocator(threshold=threshold)
         self.locator.template_paths = self.template_paths
+        self.layout = KeypadLayout()  # Fragment slots around the main print, learned from full searches
+        self.layout_resolution = None  # Resolution the layout slots were loaded for
+        self.slot_shortlist = 2  # Fragments correlated per slot, picked by their descriptors
+
+        # Repeated puzzles are answered from the cache, it is dropped when the templates or threshold change
+        self.result_cache = None
+        if result_cache_size:
+            self.result_cache = ResultCache(
+                max_entries=result_cache_size,
+                path=result_cache_path,
+                signature=file_signature(self.template_store.template_paths(), threshold),
+            )
+
+        self.detection_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="detection")
+        self.detecting = threading.Lock()  # Held from submitting a job until it finished, see request_detection()
+        self.hotkeys = []
+        self.latencies = deque(maxlen=100)  # Keypress to rectangles, in milliseconds
+
+        # Continuous scanning, see start(continuous_fps=...)
+        self.scan_timer = None
+        self.frame_change_threshold = 2.0  # Mean absolute difference of the frame signatures
+        self.frame_signature = None
+        self.frame_count = 0
+        self.tracker = BoxTracker(self.locator)  # Follows the last detection between full detections
+        self.tracked_text = None  # Overlay text of the tracked detection
 
+    def init_gui(self):
+        """Create the QApplication, the overlay and the detection signals, detect() alone does not need them."""
+        if self.app is not None:
+            return
+        self.app = QApplication.instance() or QApplication(sys.argv)
         self.overlay = RectangleOverlay(text_position=(100, 100))
-        self.update_interval = update_interval
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_overlay)
+
+        # Hotkeys fire on the keyboard hook thread, detection runs on its own worker and the
+        # results come back to the Qt thread through queued signals
+        self.signals = DetectionSignals()
+        self.signals.status.connect(self.overlay.display_text)
+        self.signals.finished.connect(self._show_detection)
+        self.signals.cleared.connect(self.clear_overlay)
 
     def _get_main_templates(self):
         """
-        Retrieve the main template image paths from the resources directory.
+        Retrieve the main template image paths from the template store.
         
         :return: List of paths to main template images.
         """
         log("Loading main template images...", level="info")
-        main_templates = []
-        for file in sorted(os.listdir(self.resources_path)):
-            file_path = os.path.join(self.resources_path, file)
-            if os.path.isfile(file_path) and file.endswith(".png"):
-                main_templates.append(file_path)
-        log(f"Main templates loaded: {main_templates}", level="success")
+        main_templates = self.template_store.main_template_paths()
+        log("Main templates loaded: %s", main_templates, level="success")
         return main_templates
 
     def _get_sub_templates(self, base_name):
@@ -50,32 +129,55 @@ class FingerprintRecognizer:
         :param base_name: Name of the main template (without extension).
         :return: List of paths to sub-template images.
         """
-        sub_templates = []
-        subfolder_path = os.path.join(self.resources_path, base_name)
-        if os.path.isdir(subfolder_path):
-            for file in sorted(os.listdir(subfolder_path)):
-                file_path = os.path.join(subfolder_path, file)
-                if os.path.isfile(file_path) and file.endswith(".png"):
-                    sub_templates.append(file_path)
-        log(f"Sub-templates loaded for {base_name}: {sub_templates}", level="info")
+        sub_templates = self.template_store.fragment_paths(base_name + ".png")
+        log("Sub-templates loaded for %s: %s", base_name, sub_templates, level="debug")
         return sub_templates
 
     def locate_on_screen(self):
         """Locate templates on the screen and update the overlay."""
+        self.init_gui()
+        rectangles, text = self.detect(status=self.overlay.display_text)
+        self._show_detection((rectangles, text, None))
+
+    def detect(self, status=None, screenshot=None):
+        """
+        Locate the main fingerprint and its fragments on the screen.
+
+        :param status: Optional callable receiving progress messages.
+        :param screenshot: Grayscale frame just taken with self.locator.take_screenshot(), captured here if omitted.
+        :return: (rectangles, text) to display on the overlay.
+        """
         log("Starting on-screen template detection...", level="info")
-        self.overlay.display_text("Taking screenshot")
+        if screenshot is None:
+            if status is not None:
+                status("Taking screenshot")
+
+            # Take a screenshot, only the keypad region once it is known
+            screenshot = self.locator.take_screenshot(grayscale=True)
+            log("Screenshot captured.", level="success")
+        origin = self.locator.last_capture_origin
 
-        # Take a screenshot
-        screenshot = self.locator.take_screenshot()
-        log("Screenshot captured.", level="success")
+        # Whole frames of different puzzles hash alike, only captures of the keypad region are cached
+        if self.result_cache is not None and self.locator.capture_region is not None:
+            cached = self.cached_detection(screenshot, origin)
+            if cached is not None:
+                return cached
 
         # Load main templates
-        log(f"Loading main templates from paths: {self.template_paths}", level="info")
+        log("Loading main templates from paths: %s", self.template_paths, level="debug")
         self.locator.load_templates(self.template_paths)
 
-        # Locate main templates
-        main_locations = self.locator.locate_images_on_screen(screenshot=screenshot, only_once=True)
-        log(f"Main template locations: {main_locations}", level="info")
+        # Locate main templates, the scale acquisition only runs on the last search of the detection
+        retry = self.learn_capture_region and self.locator.capture_region is not None
+        main_locations = self.locator.locate_calibrated(screenshot, only_once=True, origin=origin, acquire=not retry)
+        if not main_locations and retry:
+            # The keypad moved (or the resolution changed), forget the region and search the whole screen
+            log("Nothing found in the learned region, retrying on the full screen...", level="warning")
+            self.locator.capture_region = None
+            screenshot = self.locator.take_screenshot(grayscale=True)
+            origin = self.locator.last_capture_origin
+            main_locations = self.locator.locate_calibrated(screenshot, only_once=True, origin=origin)
+        log("Main template locations: %s", main_locations, level="debug")
 
         rectangles = []
         if main_locations:
@@ -83,55 +185,270 @@ class FingerprintRecognizer:
             rectangles.append(
                 (first_location["x"], first_location["y"], first_location["width"], first_location["height"])
             )
-            log(f"Main template found at: {first_location}", level="success")
+            log("Main template found at: %s", first_location, level="success")
 
             # Get sub-template paths
             base_name, _ = os.path.splitext(os.path.basename(first_location["path"]))
             sub_templates = self._get_sub_templates(base_name)
 
             # Load and locate sub-templates
-            self.locator.load_templates(sub_templates)
-            sub_locations = self.locator.locate_images_on_screen(screenshot, only_once=False)
-            log(f"Sub-template locations: {sub_locations}", level="info")
+            sub_locations = self.find_fragments(screenshot, origin, first_location, sub_templates)
+            log("Sub-template locations: %s", sub_locations, level="debug")
 
             for location in sub_locations:
                 rectangles.append(
                     (location["x"], location["y"], location["width"], location["height"])
                 )
-            self.overlay.display_text(f"Fragments found for {base_name}")
+            text = f"Fragments found for {base_name}"
+            self.tracker.update([first_location] + sub_locations)
+            self.tracked_text = text
+            if self.result_cache is not None and self.locator.capture_region is not None:
+                key, image_hash = self.frame_key(screenshot, origin)
+                self.result_cache.store(key, image_hash, {'matches': [first_location] + sub_locations, 'text': text})
+
+            if self.learn_capture_region:
+                self.locator.learn_capture_region(rectangles)
+            self.locator.calibration.save()
         else:
-            self.overlay.display_text("No fingerprint found.")
+            text = "No fingerprint found."
             log("Main template not found.", level="error")
+            self.tracker.reset()
+
+        return rectangles, text
+
+    def frame_key(self, screenshot, origin):
+        """Return the (key, perceptual hash) a frame is cached under, the key being its capture region."""
+        return (origin[0], origin[1], screenshot.shape[1], screenshot.shape[0]), perceptual_hash(screenshot)
+
+    def cached_detection(self, screenshot, origin):
+        """
+        Return (rectangles, text) of a cached detection of a near-duplicate frame, or None.
+
+        The cached boxes are correlated again at their positions (see BoxTracker.verify()), a puzzle
+        that merely hashes like the cached one is a miss.
+        """
+        def verify(cached):
+            self.tracker.update(cached['matches'])
+            matches = self.tracker.verify(screenshot, origin)
+            return None if matches is None else dict(cached, matches=matches)
+
+        key, image_hash = self.frame_key(screenshot, origin)
+        cached = self.result_cache.lookup(key, image_hash, verify)
+        metrics.count("result_cache_hits" if cached is not None else "result_cache_misses")
+        if cached is None:
+            log("Result cache miss (%d hits, %d misses, %d rejected).", self.result_cache.hits,
+                self.result_cache.misses, self.result_cache.rejected, level="debug")
+            return None
+
+        log("Result cache hit (%d hits, %d misses).", self.result_cache.hits, self.result_cache.misses, level="info")
+        self.tracked_text = cached['text']
+        rectangles = [(match["x"], match["y"], match["width"], match["height"]) for match in cached['matches']]
+        return rectangles, cached['text']
+
+    def find_fragments(self, screenshot, origin, main_location, sub_templates):
+        """
+        Locate the sub-templates of a main print match.
+
+        Only the slot windows of the keypad layout are searched, each against the slot_shortlist fragments
+        its descriptor is closest to. When the layout is not known yet or misses a fragment, the whole
+        screenshot is searched instead and the layout learns the new slots.
+        """
+        self.locator.load_templates(sub_templates)
+        resolution = self.locator.resolution()
+        if self.layout_resolution != resolution:
+            entry = self.locator.calibration.get(resolution) or {}
+            self.layout = KeypadLayout(entry.get('slots'))
+            self.layout_resolution = resolution
+
+        # Fragments share the UI scale of the main print, the full search allows a single step either side
+        bounds = (origin[0], origin[1], screenshot.shape[1], screenshot.shape[0])
+        slot_rects = self.layout.slot_rects(main_location, bounds)
+        if slot_rects:
+            slot_boxes = self.layout.slot_rects(main_location, bounds, margin=0)
+            shortlist = self.locator.rank_slots(screenshot, slot_boxes, origin, self.slot_shortlist)
+            sub_locations = self.locator.match_slots(screenshot, slot_rects, [main_location['scale']], origin, shortlist)
+            if len(sub_locations) >= len(self.locator.templates):
+                return sub_locations
+            log("Keypad layout matched %d of %d fragments, searching the whole screenshot...",
+                len(sub_locations), len(self.locator.templates), level="info")
+
+        step = self.locator.calibration.fine_step
+        scales = [round(main_location['scale'] + step * offset, 4) for offset in (-1, 0, 1)]
+        sub_locations = self.locator.locate_images_on_screen(screenshot, origin=origin, scales=scales)
+        boxes = [(location["x"], location["y"], location["width"], location["height"]) for location in sub_locations]
+        if self.layout.learn(main_location, boxes):
+            log("Keypad layout knows %d slots.", len(self.layout.slots), level="info")
+            self.locator.calibration.set_slots(resolution, self.layout.slots)
+        return sub_locations
+
+    def _show_detection(self, result):
+        """Put a detection result on the overlay, runs on the Qt thread."""
+        rectangles, text, pressed_at = result
+        with metrics.timer("overlay_update"):
+            self.overlay.display_text(text)
+            self.overlay.set_rectangles(rectangles)
+        log("Overlay updated with %d rectangles: %s", len(rectangles), rectangles, level="success")
+
+        if pressed_at is not None:
+            latency = (time.perf_counter() - pressed_at) * 1000
+            self.latencies.append(latency)
+            log(f"Keypress to overlay: {latency:.0f} ms", level="info")
+
+    def request_detection(self):
+        """Hotkey callback: run a detection on the worker unless one is already running."""
+        pressed_at = time.perf_counter()
+        # The keyboard hook and the scan timer run on different threads, the lock lets only one of them in
+        if not self.detecting.acquire(blocking=False):
+            log("Detection already running, ignoring key press.", level="warning")
+            return
+
+        log("Refreshing overlay...", level="success")
+        self.submit_job(self._detection_job, pressed_at)
 
-        # Update the overlay with the rectangles
-        self.overlay.rectangles = rectangles
-        log(f"Overlay updated with rectangles: {rectangles}", level="success")
+    def submit_job(self, job, *args):
+        """Run a job on the detection worker, the caller holds self.detecting and the job releases it."""
+        try:
+            self.detection_worker.submit(job, *args)
+        except RuntimeError:
+            self.detecting.release()  # The worker was shut down
+            raise
+
+    def _detection_job(self, pressed_at):
+        """Run a detection on the worker thread and hand the result to the Qt thread."""
+        try:
+            rectangles, text = self.detect(status=self.signals.status.emit)
+        except Exception as e:
+            log(f"Detection failed: {e}", level="error")
+            rectangles, text = [], "Detection failed."
+        finally:
+            self.detecting.release()
+        self.signals.finished.emit((rectangles, text, pressed_at))
+
+    def request_scan(self):
+        """Continuous-mode tick: scan a frame on the worker, dropping the tick if the worker is still busy."""
+        self.frame_count += 1
+        if not self.detecting.acquire(blocking=False):
+            log(f"Frame {self.frame_count}: worker busy, frame dropped.", level="warning")
+            return
+
+        self.submit_job(self._scan_job, self.frame_count, time.perf_counter())
+
+    def frame_changed(self, screenshot):
+        """Compare a tiny signature of the frame with the previous one, True if matching is worth it."""
+        signature = cv2.resize(screenshot, (32, 18), interpolation=cv2.INTER_AREA).astype(np.int16)
+        previous, self.frame_signature = self.frame_signature, signature
+        if previous is None or previous.shape != signature.shape:
+            return True
+        return float(np.abs(signature - previous).mean()) >= self.frame_change_threshold
+
+    def _scan_job(self, frame, started_at):
+        """
+        Capture a frame and, if it changed since the last one, update the detection.
+
+        The boxes of the last detection are verified around their previous positions first, the full
+        detection only runs when that fails or the tracker asks for it (see BoxTracker.max_frames).
+        """
+        try:
+            screenshot = self.locator.take_screenshot(grayscale=True)
+            captured_at = time.perf_counter()
+            if not self.frame_changed(screenshot):
+                log(f"Frame {frame}: capture {(captured_at - started_at) * 1000:.1f} ms, unchanged, skipped.", level="info")
+                return
+
+            tracked = self.tracker.verify(screenshot, self.locator.last_capture_origin)
+            if tracked is not None:
+                rectangles = [(match["x"], match["y"], match["width"], match["height"]) for match in tracked]
+                text, mode = self.tracked_text, "track"
+            else:
+                rectangles, text = self.detect(screenshot=screenshot)
+                mode = "match"
+            log(
+                f"Frame {frame}: capture {(captured_at - started_at) * 1000:.1f} ms, "
+                f"{mode} {(time.perf_counter() - captured_at) * 1000:.1f} ms.",
+                level="info",
+            )
+        except Exception as e:
+            log(f"Frame {frame}: detection failed: {e}", level="error")
+            return
+        finally:
+            self.detecting.release()
+        self.signals.finished.emit((rectangles, text, None))
+
+    def request_clear(self):
+        """Hotkey callback: clear the overlay from the Qt thread."""
+        self.signals.cleared.emit()
+
+    def latency_stats(self):
+        """Return the last, mean and 95th percentile keypress-to-overlay latency in milliseconds."""
+        if not self.latencies:
+            return None
+        latencies = np.array(self.latencies)
+        return {
+            'count': len(latencies),
+            'last_ms': float(latencies[-1]),
+            'mean_ms': float(latencies.mean()),
+            'p95_ms': float(np.percentile(latencies, 95)),
+        }
 
     def clear_overlay(self):
         """Clear the overlay."""
         log("Clearing overlay rectangles...", level="warning")
-        self.overlay.rectangles = []
+        self.overlay.set_rectangles([])
 
-    def update_overlay(self):
-        """Check for key inputs and update overlay."""
-        log("Waiting for key input...", level="info")
+    def register_hotkeys(self):
+        """Register the 'n' (locate) and 'x' (clear) hotkeys."""
+        import keyboard  # Installs a global keyboard hook, only wanted by the interactive modes
 
-        if keyboard.is_pressed("n"):
-            log("Refreshing overlay...", level="success")
-            self.locate_on_screen()
-            self.overlay.update()
+        if not self.hotkeys:
+            self.hotkeys = [
+                keyboard.add_hotkey("n", self.request_detection),
+                keyboard.add_hotkey("x", self.request_clear),
+            ]
 
-        if keyboard.is_pressed("x"):
-            log("Clearing overlay...", level="error")
-            self.clear_overlay()
-            self.overlay.update()
+    def stop(self):
+        """Remove the hotkeys, stop continuous scanning, hide the overlay and save the result cache."""
+        if self.hotkeys:
+            import keyboard
 
-    def start(self):
-        """Start the application and overlay."""
+            for hotkey in self.hotkeys:
+                keyboard.remove_hotkey(hotkey)
+            self.hotkeys = []
+        if self.scan_timer is not None:
+            self.scan_timer.stop()
+            self.scan_timer = None
+        if self.overlay is not None:
+            self.overlay.hide()
+        if self.result_cache is not None:
+            self.result_cache.save()  # store() only writes every save_interval seconds
+
+    def start(self, continuous_fps=None):
+        """
+        Start the application and overlay.
+
+        The Qt event loop idles until a hotkey is pressed. With continuous_fps a frame is scanned
+        at that rate as well, frames that did not change since the last one are not matched.
+        """
+        self.init_gui()
         log("Application started. Press 'n' to locate and 'x' to clear.", level="info")
-        self.timer.start(self.update_interval)
+        self.register_hotkeys()
+        if continuous_fps:
+            self.frame_signature = None
+            self.scan_timer = QTimer()
+            self.scan_timer.timeout.connect(self.request_scan)
+            self.scan_timer.start(max(1, int(1000 / continuous_fps)))
+            log(f"Continuous scanning at {continuous_fps} FPS.", level="info")
+
+        # Qt does not return to Python while idling, wake up a few times a second so Ctrl+C is handled
+        signal.signal(signal.SIGINT, lambda *_: self.app.quit())
+        interrupt_timer = QTimer()
+        interrupt_timer.timeout.connect(lambda: None)
+        interrupt_timer.start(250)
+
         self.overlay.show()
-        sys.exit(self.app.exec_())
+        exit_code = self.app.exec_()
+        if self.result_cache is not None:
+            self.result_cache.save()
+        sys.exit(exit_code)
 
 
 # Example usage:
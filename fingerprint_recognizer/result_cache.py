@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from .utils.logger import log
+
+
+def perceptual_hash(image, hash_size=16):
+    """
+    Return the difference hash of a grayscale image as an int of hash_size * hash_size bits.
+
+    Each bit tells whether a cell of the downsampled image is brighter than its right neighbour,
+    so small shifts in brightness or compression noise flip few bits.
+    """
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    return int.from_bytes(np.packbits(small[:, 1:] > small[:, :-1]).tobytes(), "big")
+
+
+def file_signature(paths, *extra):
+    """Return a digest of the paths, their mtimes and sizes, plus any extra values (e.g. the threshold)."""
+    digest = hashlib.sha1()
+    for path in sorted(paths):
+        stat = os.stat(path)
+        digest.update(f"{path}|{stat.st_mtime}|{stat.st_size}\n".encode("utf-8"))
+    for value in extra:
+        digest.update(f"{value}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_entries=64, max_distance=6, path=None, signature=None, save_interval=30.0):
+        """
+        Bounded LRU of detection results, looked up by a perceptual hash of the screenshot.
+
+        A lookup hits when an entry with the same key (capture region) has a hash at most
+        max_distance bits away, so a near-duplicate frame reuses the result of the first one.
+
+        :param max_entries: Entries kept, least recently used ones are dropped first.
+        :param max_distance: Hamming distance up to which two hashes count as the same frame.
+        :param path: Optional JSON file the cache is persisted to between sessions.
+        :param signature: Digest of the templates and settings (see file_signature()), a persisted cache
+            with another signature is discarded.
+        :param save_interval: Seconds between two writes of the file by store(), call save() on shutdown for the rest.
+        """
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.path = path
+        self.signature = signature
+        self.save_interval = save_interval
+        self.dirty = False  # Changed since the last save
+        self._saved_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0  # Near-duplicate hashes whose result did not verify
+        self._entries = OrderedDict()  # (key, hash) -> result
+        self._lock = threading.Lock()
+        self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, key, image_hash, verify=None):
+        """
+        Return the result stored for a near-duplicate of the hash under key, or None.
+
+        A close hash only says that two frames look alike. With verify, the candidates are tried
+        nearest first and verify(result) returns the result to use, or None to skip the entry, which
+        stays valid for the puzzle it was stored for.
+        """
+        with self._lock:
+            candidates = sorted(
+                (bin(entry_hash ^ image_hash).count("1"), (entry_key, entry_hash))
+                for entry_key, entry_hash in self._entries if entry_key == key
+            )
+            candidates = [(entry, self._entries[entry]) for distance, entry in candidates if distance <= self.max_distance]
+
+        for entry, result in candidates:
+            if verify is not None:
+                result = verify(result)
+            with self._lock:
+                if result is None:
+                    self.rejected += 1
+                    continue
+                self.hits += 1
+                if entry in self._entries:
+                    self._entries.move_to_end(entry)
+                return result
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, key, image_hash, result):
+        """Store a JSON-serializable result, the file is rewritten at most every save_interval seconds."""
+        with self._lock:
+            self._entries[(key, image_hash)] = result
+            self._entries.move_to_end((key, image_hash))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.dirty = True
+        if time.monotonic() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def invalidate(self, signature=None):
+        """Drop every entry, e.g. after the templates changed, and adopt the new signature."""
+        with self._lock:
+            self._entries.clear()
+            if signature is not None:
+                self.signature = signature
+            self.dirty = True
+        self.save()
+
+    def stats(self):
+        """Return the hit, miss and rejection counters and the number of entries."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'rejected': self.rejected,
+            'entries': len(self._entries),
+        }
+
+    def load(self):
+        """Read the persisted entries, a missing or broken file or another signature starts empty."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get('signature') != self.signature:
+                log(f"Result cache {self.path} was built for other templates, discarding it.", level="info")
+                return
+            for item in data['entries'][-self.max_entries:]:
+                self._entries[(tuple(item['key']), int(item['hash'], 16))] = item['result']
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log(f"Ignoring result cache {self.path}: {e}", level="warning")
+            self._entries.clear()
+
+    def save(self):
+        """Write the entries to disk, if a path is configured and something changed."""
+        if not self.path or not self.dirty:
+            return
+        with self._lock:
+            self.dirty = False
+            self._saved_at = time.monotonic()
+            entries = [
+                {'key': list(key), 'hash': format(image_hash, "x"), 'result': result}
+                for (key, image_hash), result in self._entries.items()
+            ]
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as file:
+                json.dump({'signature': self.signature, 'entries': entries}, file)
+        except OSError as e:
+            log(f"Could not save result cache to {self.path}: {e}", level="warning")
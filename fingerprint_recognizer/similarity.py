@@ -0,0 +1,63 @@
+import cv2
+import numpy as np
+
+
+def integral_tables(image):
+    """Return the integral image and the integral of squares (float64) of an image."""
+    return cv2.integral2(image, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+
+
+def window_sums(image, h, w, tables=None):
+    """
+    Return the sum and the sum of squares of every h x w window of the image, from its integral images.
+
+    tables are the integral_tables() of the image, computed here if omitted.
+    """
+    integral, integral_sq = tables if tables is not None else integral_tables(image)
+
+    def windows(table):
+        return table[h:, w:] - table[:-h, w:] - table[h:, :-w] + table[:-h, :-w]
+
+    return windows(integral), windows(integral_sq)
+
+
+def ssim_map(image, template, stride=1, data_range=255.0):
+    """
+    SSIM between the template and every template-sized window of the image.
+
+    The statistics are taken over the whole window: the window means and variances come from
+    integral images and the covariance from a single (FFT based) cv2.matchTemplate correlation,
+    so every position is scored at once instead of calling an SSIM function per window.
+
+    :param image: 2D grayscale image.
+    :param template: 2D grayscale template, not larger than the image.
+    :param stride: Only every stride-th row and column of the map is returned.
+    :return: Map of shape ((H - h) // stride + 1, (W - w) // stride + 1), entry (i, j) scores the
+        window at (x=j * stride, y=i * stride).
+    """
+    image = np.asarray(image, dtype=np.float32)
+    template = np.asarray(template, dtype=np.float32)
+    h, w = template.shape[:2]
+    n = float(h * w)
+
+    c1 = (0.01 * data_range) ** 2
+    c2 = (0.03 * data_range) ** 2
+
+    template_mean = float(template.mean())
+    template_var = float(template.var())
+
+    sums, sq_sums = window_sums(image, h, w)
+    window_mean = sums / n
+    window_var = np.maximum(sq_sums / n - window_mean ** 2, 0.0)
+
+    # sum(x * (t - mean_t)) over the window is n * cov(x, t), the zero-mean template keeps float32 accurate
+    covariance = cv2.matchTemplate(image, template - template_mean, cv2.TM_CCORR).astype(np.float64) / n
+
+    if stride > 1:
+        window_mean = window_mean[::stride, ::stride]
+        window_var = window_var[::stride, ::stride]
+        covariance = covariance[::stride, ::stride]
+
+    numerator = (2.0 * window_mean * template_mean + c1) * (2.0 * covariance + c2)
+    denominator = (window_mean ** 2 + template_mean ** 2 + c1) * (window_var + template_var + c2)
+    return numerator / denominator
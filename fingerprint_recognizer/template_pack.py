@@ -0,0 +1,226 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+from .template_store import TemplateStore, template_scales
+from .utils.logger import log
+
+
+PACK_MAGIC = b"FPPACK\0\0"
+PACK_VERSION = 1
+DEFAULT_PACK_NAME = "templates.fppack"  # Looked up in the resources directory
+
+_HEADER = struct.Struct("<8sIQ")  # Magic, version, length of the JSON metadata
+_ALIGN = 64  # Every array starts on a cache line
+
+
+def _aligned(offset):
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+def _relative(path, resources_path):
+    return os.path.relpath(path, resources_path).replace(os.sep, "/")
+
+
+def build_pack(resources_path, pack_path=None, scale_range=(0.2, 2.1), scale_step=0.5):
+    """
+    Compile the templates of a resources directory into one binary pack and return its path.
+
+    The pack starts with a header and a JSON metadata table (templates, their arrays, main print ->
+    fragments) followed by the raw, grayscale, blurred and pre-scaled arrays of every template.
+    """
+    pack_path = pack_path or os.path.join(resources_path, DEFAULT_PACK_NAME)
+    store = TemplateStore(resources_path, scale_range=scale_range, scale_step=scale_step)
+
+    arrays = []
+    size = 0
+
+    def place(array):
+        nonlocal size
+        array = np.ascontiguousarray(array)
+        offset = _aligned(size)
+        arrays.append((offset, array))
+        size = offset + array.nbytes
+        return {'offset': offset, 'shape': list(array.shape), 'dtype': array.dtype.str}
+
+    templates = {}
+    for path in store.template_paths():
+        entry = store.get(path)
+        if entry is None:
+            continue
+        stat = os.stat(path)
+        templates[_relative(path, resources_path)] = {
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'image': place(entry['image']),
+            'grayscale': place(entry['grayscale']),
+            'blurred': place(entry['blurred']),
+            'scaled': [dict(place(array), scale=scale) for scale, array in entry['scaled']],
+        }
+        store.clear()  # Only one template needs to be in memory at a time
+
+    mains = {
+        _relative(main_path, resources_path): [_relative(path, resources_path) for path in store.fragment_paths(main_path)]
+        for main_path in store.main_template_paths()
+    }
+    metadata = json.dumps({
+        'version': PACK_VERSION,
+        'scale_range': list(scale_range),
+        'scale_step': scale_step,
+        'scales': store.scales,
+        'templates': templates,
+        'mains': mains,
+    }).encode("utf-8")
+
+    data_start = _aligned(_HEADER.size + len(metadata))
+    temporary_path = pack_path + ".tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(_HEADER.pack(PACK_MAGIC, PACK_VERSION, len(metadata)))
+        file.write(metadata)
+        for offset, array in arrays:
+            file.seek(data_start + offset)
+            file.write(array.tobytes())
+        file.truncate(data_start + size)
+    os.replace(temporary_path, pack_path)  # Readers never see a half-written pack
+
+    log(f"Packed {len(templates)} templates into {pack_path} ({(data_start + size) // 1024} KiB).", level="success")
+    return pack_path
+
+
+class TemplatePack:
+    def __init__(self, pack_path, resources_path=None):
+        """
+        Serve the templates of a pack written by build_pack(), a drop-in for TemplateStore.
+
+        The file is memory-mapped and every array is a read-only view into it, so opening the pack
+        neither decodes nor copies anything.
+
+        :param pack_path: Pack file.
+        :param resources_path: Directory the template paths are resolved against, the one of the pack by default.
+        :raises ValueError: If the file is not a pack or was written by another version.
+        """
+        self.pack_path = pack_path
+        self.resources_path = resources_path or os.path.dirname(pack_path)
+        self.buffer = np.memmap(pack_path, dtype=np.uint8, mode="r")
+        if len(self.buffer) < _HEADER.size:
+            raise ValueError(f"{pack_path} is not a template pack.")
+
+        magic, version, metadata_size = _HEADER.unpack(bytes(self.buffer[:_HEADER.size]))
+        if magic != PACK_MAGIC:
+            raise ValueError(f"{pack_path} is not a template pack.")
+        if version != PACK_VERSION:
+            raise ValueError(f"{pack_path} has version {version}, expected {PACK_VERSION}.")
+        metadata = json.loads(bytes(self.buffer[_HEADER.size:_HEADER.size + metadata_size]).decode("utf-8"))
+
+        self.scale_range = tuple(metadata['scale_range'])
+        self.scale_step = metadata['scale_step']
+        self.scales = metadata['scales']
+        self.records = metadata['templates']
+        self._data_start = _aligned(_HEADER.size + metadata_size)
+
+        self._entries = {}
+        self.current_bytes = 0
+        for relative, record in self.records.items():
+            entry = self._make_entry(self._path(relative), record)
+            self._entries[entry['path']] = entry
+            self.current_bytes += entry['nbytes']
+
+        self._fragments = {}  # Main print base name -> fragment paths
+        for relative, fragments in metadata['mains'].items():
+            base_name, _ = os.path.splitext(os.path.basename(relative))
+            self._fragments[base_name] = (self._path(relative), [self._path(fragment) for fragment in fragments])
+
+    def _path(self, relative):
+        return os.path.join(self.resources_path, *relative.split("/"))
+
+    def _array(self, record):
+        """Return the read-only view of an array record."""
+        start = self._data_start + record['offset']
+        dtype = np.dtype(record['dtype'])
+        count = int(np.prod(record['shape'], dtype=np.int64))
+        return self.buffer[start:start + count * dtype.itemsize].view(dtype).reshape(record['shape'])
+
+    def _make_entry(self, path, record):
+        scaled = [(round(float(item['scale']), 4), self._array(item)) for item in record['scaled']]
+        image, grayscale, blurred = (self._array(record[name]) for name in ('image', 'grayscale', 'blurred'))
+        return {
+            'path': path,
+            'image': image,
+            'grayscale': grayscale,
+            'blurred': blurred,
+            'scaled': scaled,
+            'nbytes': image.nbytes + grayscale.nbytes + blurred.nbytes + sum(array.nbytes for _, array in scaled),
+        }
+
+    def template_paths(self):
+        """Return every template path of the pack, sorted."""
+        return sorted(self._entries)
+
+    def main_template_paths(self):
+        """Return the main print paths, sorted."""
+        return sorted(main_path for main_path, _ in self._fragments.values())
+
+    def fragment_paths(self, main_path):
+        """Return the fragment paths of a main print."""
+        base_name, _ = os.path.splitext(os.path.basename(main_path))
+        _, fragments = self._fragments.get(base_name, (None, []))
+        return list(fragments)
+
+    def preload(self):
+        """Nothing to decode, log the size of the pack like TemplateStore.preload()."""
+        log(f"Template pack holds {len(self._entries)} templates ({self.current_bytes // 1024} KiB).", level="success")
+        return self.template_paths()
+
+    def get(self, path):
+        """Return the template entry for a path, or None if it is not in the pack."""
+        entry = self._entries.get(path)
+        if entry is None:
+            log(f"Template not in pack: {path}", level="warning")
+        return entry
+
+    def get_many(self, paths):
+        """Return the template entries for several paths, skipping the ones that are not in the pack."""
+        return [entry for entry in (self.get(path) for path in paths) if entry is not None]
+
+    def clear(self):
+        """Entries are views into the file, there is nothing to drop."""
+
+    def is_stale(self):
+        """Return True if a PNG of the resources directory was added, removed or changed since the pack was built."""
+        on_disk = {_relative(path, self.resources_path) for path in TemplateStore(self.resources_path).template_paths()}
+        if on_disk != set(self.records):
+            return True
+        for relative, record in self.records.items():
+            stat = os.stat(self._path(relative))
+            if stat.st_mtime != record['mtime'] or stat.st_size != record['size']:
+                return True
+        return False
+
+
+def open_templates(resources_path, scale_range=(0.2, 2.1), scale_step=0.5, cache_dir=None, pack_path=None):
+    """
+    Return the TemplatePack of a resources directory when it is usable, a preloaded TemplateStore otherwise.
+
+    A pack that is missing, broken, built for other scales or older than the PNGs is not used.
+    """
+    pack_path = pack_path or os.path.join(resources_path, DEFAULT_PACK_NAME)
+    if os.path.exists(pack_path):
+        try:
+            pack = TemplatePack(pack_path, resources_path)
+        except (OSError, ValueError) as e:
+            log(f"Ignoring template pack {pack_path}: {e}", level="warning")
+        else:
+            if pack.scales != template_scales(scale_range, scale_step):
+                log(f"Ignoring template pack {pack_path}: built for other scales.", level="warning")
+            elif pack.is_stale():
+                log(f"Ignoring template pack {pack_path}: the resources changed, rebuild it with 'python main.py pack'.",
+                    level="warning")
+            else:
+                pack.preload()
+                return pack
+
+    store = TemplateStore(resources_path, scale_range=scale_range, scale_step=scale_step, cache_dir=cache_dir)
+    store.preload()
+    return store
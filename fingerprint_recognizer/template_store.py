@@ -0,0 +1,193 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from .utils.logger import log
+
+
+def preprocess_template(image):
+    """Blur a grayscale template the same way ImageLocator blurs the screenshot."""
+    return cv2.GaussianBlur(image, (5, 5), 0)
+
+
+def template_scales(scale_range, scale_step):
+    """Return the list of scales swept by the matcher, rounded so they can be used as keys."""
+    return [round(float(scale), 4) for scale in np.arange(scale_range[0], scale_range[1], scale_step)]
+
+
+class TemplateStore:
+    def __init__(self, resources_path, scale_range=(0.2, 2.1), scale_step=0.5,
+                 max_bytes=256 * 1024 * 1024, cache_dir=None):
+        """
+        Keep decoded, blurred and pre-scaled templates in memory.
+
+        :param resources_path: Directory holding the template PNGs (searched recursively).
+        :param scale_range: (start, stop) of the scales precomputed for every template.
+        :param scale_step: Step between two precomputed scales.
+        :param max_bytes: Upper bound for the in-memory cache, least recently used entries are dropped first.
+        :param cache_dir: Optional directory for the on-disk cache, keyed by file path and mtime.
+        """
+        self.resources_path = resources_path
+        self.scale_range = scale_range
+        self.scale_step = scale_step
+        self.scales = template_scales(scale_range, scale_step)
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def template_paths(self):
+        """Return every PNG under the resources directory, sorted."""
+        paths = []
+        for root, _, files in os.walk(self.resources_path):
+            for file in files:
+                if file.endswith(".png"):
+                    paths.append(os.path.join(root, file))
+        return sorted(paths)
+
+    def main_template_paths(self):
+        """Return the main print PNGs, the ones directly in the resources directory."""
+        return sorted(
+            os.path.join(self.resources_path, file) for file in os.listdir(self.resources_path)
+            if file.endswith(".png") and os.path.isfile(os.path.join(self.resources_path, file))
+        )
+
+    def fragment_paths(self, main_path):
+        """Return the fragment PNGs of a main print, from the folder named like it."""
+        base_name, _ = os.path.splitext(os.path.basename(main_path))
+        folder = os.path.join(self.resources_path, base_name)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(os.path.join(folder, file) for file in os.listdir(folder) if file.endswith(".png"))
+
+    def preload(self):
+        """Decode and precompute every template under the resources directory."""
+        paths = self.template_paths()
+        for path in paths:
+            self.get(path)
+        log(f"Template store holds {len(self._entries)} templates ({self.current_bytes // 1024} KiB).", level="success")
+        return paths
+
+    def get(self, path):
+        """Return the template entry for a path, building it on a miss."""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                self._entries.move_to_end(path)
+                return entry
+
+        entry = self._build(path)
+        if entry is None:
+            return None
+
+        with self._lock:
+            if path not in self._entries:
+                self._entries[path] = entry
+                self.current_bytes += entry['nbytes']
+                self._evict()
+            return self._entries.get(path, entry)
+
+    def get_many(self, paths):
+        """Return the template entries for several paths, skipping the ones that could not be loaded."""
+        entries = []
+        for path in paths:
+            entry = self.get(path)
+            if entry is not None:
+                entries.append(entry)
+        return entries
+
+    def clear(self):
+        """Drop every in-memory entry."""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits into max_bytes (keeps at least one)."""
+        while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self.current_bytes -= entry['nbytes']
+
+    def _cache_file(self, path):
+        """Return the on-disk cache file for a template, or None if disk caching is disabled."""
+        if not self.cache_dir:
+            return None
+        mtime = os.path.getmtime(path)
+        key = f"{os.path.abspath(path)}|{mtime}|{self.scale_range}|{self.scale_step}"
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".npz")
+
+    def _build(self, path):
+        """Decode a template and precompute its blurred grayscale image at every scale."""
+        if not os.path.exists(path):
+            print(f"Template file not found: {path}")
+            return None
+
+        cache_file = self._cache_file(path)
+        if cache_file and os.path.exists(cache_file):
+            entry = self._load_cache(path, cache_file)
+            if entry is not None:
+                return entry
+
+        image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            print(f"Failed to load image: {path}")
+            return None
+
+        if image.ndim == 2:
+            grayscale = image
+        elif image.shape[-1] == 4:
+            grayscale = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+        else:
+            grayscale = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        blurred = preprocess_template(grayscale)
+        scaled = []
+        for scale in self.scales:
+            scaled.append((scale, cv2.resize(blurred, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)))
+
+        entry = self._make_entry(path, image, grayscale, blurred, scaled)
+        if cache_file:
+            self._save_cache(entry, cache_file)
+        return entry
+
+    def _make_entry(self, path, image, grayscale, blurred, scaled):
+        """Bundle the arrays of a template into the dict layout used by ImageLocator."""
+        nbytes = image.nbytes + grayscale.nbytes + blurred.nbytes + sum(array.nbytes for _, array in scaled)
+        return {
+            'path': path,
+            'image': image,
+            'grayscale': grayscale,
+            'blurred': blurred,
+            'scaled': scaled,
+            'nbytes': nbytes,
+        }
+
+    def _save_cache(self, entry, cache_file):
+        """Write a template entry to the on-disk cache."""
+        arrays = {'image': entry['image'], 'grayscale': entry['grayscale'], 'blurred': entry['blurred'],
+                  'scales': np.array([scale for scale, _ in entry['scaled']], dtype=np.float64)}
+        for i, (_, array) in enumerate(entry['scaled']):
+            arrays[f"scaled_{i}"] = array
+        try:
+            np.savez(cache_file, **arrays)
+        except OSError as e:
+            log(f"Could not write template cache {cache_file}: {e}", level="warning")
+
+    def _load_cache(self, path, cache_file):
+        """Read a template entry from the on-disk cache, or None if the file is unusable."""
+        try:
+            with np.load(cache_file) as data:
+                scales = [round(float(scale), 4) for scale in data['scales']]
+                scaled = [(scale, data[f"scaled_{i}"]) for i, scale in enumerate(scales)]
+                return self._make_entry(path, data['image'], data['grayscale'], data['blurred'], scaled)
+        except (OSError, KeyError, ValueError) as e:
+            log(f"Ignoring broken template cache {cache_file}: {e}", level="warning")
+            return None
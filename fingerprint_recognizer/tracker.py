@@ -0,0 +1,85 @@
+import cv2
+
+from .utils.metrics import metrics
+
+
+class BoxTracker:
+    def __init__(self, locator, search_margin=0.15, min_padding=8, max_frames=30):
+        """
+        Follow the last confirmed matches from frame to frame instead of detecting them again.
+
+        Each match is only searched for in a small window around its previous box, at the scale it
+        was found at. The templates come from locator.template_store.
+
+        :param locator: ImageLocator the tracked matches were found with.
+        :param search_margin: Fraction of the box size searched around it on every side.
+        :param min_padding: Smallest search padding in pixels.
+        :param max_frames: Frames tracked before a full detection is forced again.
+        """
+        self.locator = locator
+        self.search_margin = search_margin
+        self.min_padding = min_padding
+        self.max_frames = max_frames
+        self.tracks = []  # (match dict, scaled template)
+        self.frames = 0  # Frames verified since the last full detection
+
+    def reset(self):
+        """Drop every track, the next frame needs a full detection."""
+        self.tracks = []
+        self.frames = 0
+
+    def update(self, matches):
+        """Track the matches of a full detection (match dicts with path and scale)."""
+        tracks = []
+        for match in matches:
+            template_data = self.locator.template_store.get(match['path'])
+            if template_data is None:
+                self.reset()
+                return
+            _, template = next(self.locator.scaled_templates(template_data, [match['scale']]))
+            tracks.append((dict(match), template))
+        self.tracks = tracks
+        self.frames = 0
+
+    def verify(self, screenshot, origin=(0, 0)):
+        """
+        Look for every tracked match near its last position in a grayscale screenshot.
+
+        :return: The updated match dicts, or None when one of them was lost or max_frames is reached.
+        """
+        if not self.tracks or self.frames >= self.max_frames:
+            return None
+
+        screen_h, screen_w = screenshot.shape[:2]
+
+        def verify_track(track):
+            match, template = track
+            h, w = template.shape[:2]
+            pad_x = max(self.min_padding, int(w * self.search_margin))
+            pad_y = max(self.min_padding, int(h * self.search_margin))
+            x0 = max(0, match['x'] - origin[0] - pad_x)
+            y0 = max(0, match['y'] - origin[1] - pad_y)
+            x1 = min(screen_w, match['x'] - origin[0] + w + pad_x)
+            y1 = min(screen_h, match['y'] - origin[1] + h + pad_y)
+            if x1 - x0 < w or y1 - y0 < h:
+                return None
+
+            window = self.locator.preprocess_image(screenshot[y0:y1, x0:x1])
+            _, score, _, (x, y) = cv2.minMaxLoc(cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED))
+            if score < self.locator.threshold:
+                return None
+            return dict(match, x=int(x0 + x) + origin[0], y=int(y0 + y) + origin[1], score=float(score))
+
+        with metrics.timer("track", boxes=len(self.tracks)):
+            futures = [self.locator.executor().submit(verify_track, track) for track in self.tracks]
+            matches = [future.result() for future in futures]
+
+        if any(match is None for match in matches):
+            metrics.count("tracks_lost")
+            self.reset()
+            return None
+
+        self.tracks = [(match, template) for match, (_, template) in zip(matches, self.tracks)]
+        self.frames += 1
+        metrics.count("frames_tracked")
+        return matches
@@ -1,4 +1,5 @@
 # utils/__init__.py
-from .logger import log
+from .logger import log, set_level
+from .metrics import Metrics, metrics
 
-__all__ = ["log"]
+__all__ = ["log", "set_level", "Metrics", "metrics"]
@@ -1,11 +1,52 @@
-def log(message, level="info"):
-    """Log messages with different levels and colors."""
-    colors = {
-        "info": "\033[94m",  # Blue
-        "success": "\033[92m",  # Green
-        "warning": "\033[93m",  # Yellow
-        "error": "\033[91m",  # Red
-        "reset": "\033[0m",  # Reset color
-    }
+import threading
+
+LEVELS = {
+    "debug": 10,
+    "info": 20,
+    "success": 25,
+    "warning": 30,
+    "error": 40,
+}
+
+colors = {
+    "debug": "\033[90m",  # Grey
+    "info": "\033[94m",  # Blue
+    "success": "\033[92m",  # Green
+    "warning": "\033[93m",  # Yellow
+    "error": "\033[91m",  # Red
+    "reset": "\033[0m",  # Reset color
+}
+
+_threshold = LEVELS["info"]
+_lock = threading.Lock()
+
+
+def set_level(level):
+    """Only log messages of this level or above ("debug", "info", "success", "warning", "error")."""
+    global _threshold
+    _threshold = LEVELS[level]
+
+
+def is_enabled(level):
+    """Return True if messages of this level are printed."""
+    return LEVELS.get(level, LEVELS["info"]) >= _threshold
+
+
+def log(message, *args, level="info"):
+    """
+    Log messages with different levels and colors.
+
+    Formatting is lazy: message may be a %-style format string with args, or a callable
+    returning the text, and neither is evaluated when the level is disabled.
+    """
+    if LEVELS.get(level, LEVELS["info"]) < _threshold:
+        return
+
+    if callable(message):
+        message = message()
+    elif args:
+        message = message % args
+
     color = colors.get(level, colors["info"])
-    print(f"{color}{message}{colors['reset']}")
+    with _lock:  # Keep lines from worker threads from interleaving
+        print(f"{color}{message}{colors['reset']}")
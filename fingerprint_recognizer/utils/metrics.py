@@ -0,0 +1,124 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+
+class _NullTimer:
+    """Shared no-op context manager handed out while metrics are disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, metrics, stage, args):
+        self.metrics = metrics
+        self.stage = stage
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.stage, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class Metrics:
+    """
+    Per-stage timers and counters.
+
+    Disabled by default: timer() then returns a shared no-op context manager and count() returns
+    right away, so the instrumentation can stay in the hot paths.
+    """
+
+    def __init__(self, max_events=100000):
+        self.enabled = False
+        self.max_events = max_events  # Trace events kept for export, older ones are dropped first
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        """Drop every recorded timing, counter and trace event."""
+        with self._lock:
+            self.stages = defaultdict(lambda: {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            self.counters = defaultdict(int)
+            self.events = []
+
+    def timer(self, stage, **args):
+        """Return a context manager timing a stage, args are kept on the trace event."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage, args)
+
+    def count(self, name, value=1):
+        """Add value to a counter."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] += value
+
+    def record(self, stage, start, end, args=None):
+        """Record a finished stage that ran from start to end (time.perf_counter() values)."""
+        duration_ms = (end - start) * 1000
+        with self._lock:
+            stats = self.stages[stage]
+            stats['count'] += 1
+            stats['total_ms'] += duration_ms
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+            if len(self.events) >= self.max_events:
+                del self.events[:len(self.events) // 2]
+            self.events.append((stage, start, end, threading.get_ident(), args))
+
+    def summary(self):
+        """Return {'stages': {stage: count/total/mean/max}, 'counters': {...}}."""
+        with self._lock:
+            stages = {
+                stage: dict(stats, mean_ms=stats['total_ms'] / stats['count'])
+                for stage, stats in self.stages.items()
+            }
+            return {'stages': stages, 'counters': dict(self.counters)}
+
+    def export_json(self, path):
+        """Write the summary to a JSON file."""
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def export_chrome_trace(self, path):
+        """Write the recorded stages as a Chrome trace (open in chrome://tracing or Perfetto)."""
+        with self._lock:
+            events = list(self.events)
+            counters = dict(self.counters)
+
+        trace = []
+        for stage, start, end, thread, args in events:
+            trace.append({
+                'name': stage,
+                'ph': 'X',
+                'ts': (start - self._origin) * 1e6,
+                'dur': (end - start) * 1e6,
+                'pid': os.getpid(),
+                'tid': thread,
+                'args': {key: str(value) for key, value in (args or {}).items()},
+            })
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({'traceEvents': trace, 'otherData': {'counters': counters}}, file)
+
+
+metrics = Metrics()
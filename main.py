@@ -1,101 +1,14 @@
 import argparse
-from textual.app import App, ComposeResult
-from textual.widgets import Button, Label, Footer, Header, Static
-from textual.containers import Vertical, Horizontal
-from fingerprint_recognizer import FingerprintRecognizer
-
-class RecognizerTUI(App):
-    """A Textual TUI for the Fingerprint Recognizer."""
-    
-    CSS_PATH = "tui_styles.css"  # Optional CSS for styling
-    BINDINGS = [
-        ("n", "refresh", "Refresh Overlay"),
-        ("x", "clear", "Clear Overlay"),
-        ("q", "quit", "Quit"),
-    ]
-
-    def __init__(self, *args, headless=False, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.headless = headless
-        self.recognizer = FingerprintRecognizer()
-        self.recognizer_running = False
-
-    def compose(self) -> ComposeResult:
-        """Compose the UI layout."""
-        if self.headless:
-            return []  # Don't compose any UI if running in headless mode
-        
-        yield Header()
-        yield Vertical(
-            Label("Fingerprint Recognizer TUI", id="title"),
-            Static("Press 'n' to refresh the overlay, 'x' to clear, and 'q' to quit."),
-            Horizontal(
-                Button("Start Recognizer", id="start_btn"),
-                Button("Stop Recognizer", id="stop_btn", disabled=True),
-                Button("Quit", id="quit_btn"),
-                id="controls",
-            ),
-            id="main",
-        )
-        yield Footer()
-
-    async def on_button_pressed(self, event: Button.Pressed) -> None:
-        """Handle button press events."""
-        button_id = event.button.id
-        if button_id == "start_btn":
-            self.start_recognizer()
-        elif button_id == "stop_btn":
-            self.stop_recognizer()
-        elif button_id == "quit_btn":
-            self.exit()
-
-    def action_refresh(self) -> None:
-        """Refresh the overlay."""
-        try:
-            if self.recognizer_running:
-                self.recognizer.locate_on_screen()
-        except Exception as e:
-            self.exit()
-            print(e)
-
-    def action_clear(self) -> None:
-        """Clear the overlay."""
-        if self.recognizer_running:
-            self.recognizer.clear_overlay()
-
-    def start_recognizer(self):
-        """Start the recognizer application."""
-        if not self.recognizer_running:
-            self.recognizer_running = True
-            self.recognizer.start()
-            self.query_one("#start_btn").disabled = True
-            self.query_one("#stop_btn").disabled = False
-            self.query_one(Static).update("Recognizer started!")
-
-    def stop_recognizer(self):
-        """Stop the recognizer application."""
-        if self.recognizer_running:
-            self.recognizer_running = False
-            self.recognizer.timer.stop()
-            self.recognizer.overlay.hide()
-            self.query_one("#start_btn").disabled = False
-            self.query_one("#stop_btn").disabled = True
-            self.query_one(Static).update("Recognizer stopped!")
-
-    def action_quit(self) -> None:
-        """Quit the TUI application."""
-        self.stop_recognizer()
-        self.exit()
-
-    def run_headless(self):
-        """Run the recognizer without TUI (headless mode)."""
-        self.start_recognizer()
-        try:
-            while self.recognizer_running:
-                # In headless mode, you can add custom logic for processing here.
-                pass  # Simulate the ongoing recognition process.
-        except KeyboardInterrupt:
-            self.stop_recognizer()
+import atexit
+import json
+import os
+import sys
+from fingerprint_recognizer.utils import metrics, set_level
+
+# The Qt, keyboard and Textual stacks are imported by the commands that need them, so batch runs
+# and --help start without them
+
+RESOURCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fingerprint_recognizer", "resources")
 
 
 def parse_args():
@@ -104,13 +17,87 @@ def parse_args():
     parser.add_argument(
         "--headless", action="store_true", help="Run the recognizer in headless mode without the TUI."
     )
+    parser.add_argument(
+        "--fps", type=float, default=None,
+        help="In headless mode, scan continuously at this rate instead of waiting for the 'n' key."
+    )
+    parser.add_argument(
+        "--log-level", default="info", choices=["debug", "info", "success", "warning", "error"],
+        help="Only print messages of this level or above."
+    )
+    parser.add_argument(
+        "--trace", metavar="PATH",
+        help="Record per-stage timings and counters, written as a Chrome trace to PATH (and a summary to PATH.summary.json) on exit."
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+    batch = subparsers.add_parser(
+        "batch", help="Detect on a folder of screenshots or a video file and write one JSON line per frame."
+    )
+    batch.add_argument("source", help="Folder of images or video file.")
+    batch.add_argument("--output", default="-", help="JSON lines file to write ('-' for stdout).")
+    batch.add_argument("--threshold", type=float, default=0.75, help="Matching threshold for image detection.")
+    batch.add_argument("--pyramid-levels", type=int, default=2, help="Depth of the coarse-to-fine search.")
+    batch.add_argument("--queue-size", type=int, default=4, help="Frames that may wait between two pipeline stages.")
+
+    pack = subparsers.add_parser(
+        "pack", help="Compile the template images into one binary pack that is memory-mapped at startup."
+    )
+    pack.add_argument("--resources", default=RESOURCES_PATH, help="Directory holding the template images.")
+    pack.add_argument("--output", default=None, help="Pack file to write (templates.fppack in the resources directory).")
     return parser.parse_args()
 
+
+def run_batch(args):
+    """Stream the frames of args.source through the detection pipeline into a JSON lines file."""
+    from fingerprint_recognizer.batch import BatchDetector
+
+    detector = BatchDetector(
+        RESOURCES_PATH, threshold=args.threshold, pyramid_levels=args.pyramid_levels, queue_size=args.queue_size
+    )
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    frames = 0
+    try:
+        for record in detector.run(args.source):
+            output.write(json.dumps(record) + "\n")
+            frames += 1
+    except (OSError, ValueError) as e:
+        # A non-zero exit lets scripts tell a bad source from a session without frames
+        sys.exit(f"Batch stopped after {frames} frames: {e}")
+    finally:
+        detector.close()
+        if output is not sys.stdout:
+            output.close()
+    print(f"Processed {frames} frames.", file=sys.stderr)
+
+
+def write_trace(path):
+    """Export the recorded metrics on exit."""
+    metrics.export_chrome_trace(path)
+    metrics.export_json(path + ".summary.json")
+    print(f"Trace written to {path}")
+
 if __name__ == "__main__":
     args = parse_args()
+    set_level(args.log_level)
+    if args.trace:
+        metrics.enable()
+        atexit.register(write_trace, args.trace)
+
+    if args.command == "batch":
+        if args.output == "-":
+            set_level("error")  # Keep stdout for the JSON lines
+        run_batch(args)
+    elif args.command == "pack":
+        from fingerprint_recognizer.template_pack import build_pack
+
+        build_pack(args.resources, args.output)
+    elif args.headless:
+        from tui import RecognizerTUI
 
-    if args.headless:
         app = RecognizerTUI(headless=True)
-        app.run_headless()  # Run without the TUI
+        app.run_headless(fps=args.fps)  # Run without the TUI
     else:
+        from tui import RecognizerTUI
+
         RecognizerTUI().run()  # Run with the TUI interface
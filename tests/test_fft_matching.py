@@ -0,0 +1,96 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from fingerprint_recognizer.fft_matching import FFTEngine
+from fingerprint_recognizer.image_locator import ImageLocator
+
+
+RESOURCES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fingerprint_recognizer", "resources")
+MAX_DIFFERENCE = 1e-4
+
+
+def scene_with_fragments(rng, paths, scales, size=(360, 640)):
+    """Return a blurred noise screenshot with each fragment pasted at its scale, side by side."""
+    noise = rng.integers(0, 256, (size[0] // 8 + 1, size[1] // 8 + 1), dtype=np.uint8)
+    scene = cv2.GaussianBlur(cv2.resize(noise, size[::-1], interpolation=cv2.INTER_LINEAR), (9, 9), 0)
+    x = 10
+    for path, scale in zip(paths, scales):
+        fragment = cv2.resize(cv2.imread(path, cv2.IMREAD_GRAYSCALE), None, fx=scale, fy=scale)
+        scene[20:20 + fragment.shape[0], x:x + fragment.shape[1]] = fragment
+        x += fragment.shape[1] + 15
+    return scene
+
+
+@pytest.mark.parametrize("template_shape", [(7, 9), (31, 24), (64, 64), (120, 200)])
+def test_random_images_match_opencv(template_shape):
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (240, 320), dtype=np.uint8)
+    template = rng.integers(0, 256, template_shape, dtype=np.uint8)
+
+    expected = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+    actual = FFTEngine().match_template(image, template)
+
+    assert actual.shape == expected.shape
+    assert np.abs(actual - expected).max() <= MAX_DIFFERENCE
+
+
+def test_template_cut_from_image_peaks_at_its_position():
+    rng = np.random.default_rng(1)
+    image = cv2.GaussianBlur(rng.integers(0, 256, (200, 300), dtype=np.uint8), (5, 5), 0)
+    template = image[50:90, 120:170].copy()
+
+    expected = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+    actual = FFTEngine().match_template(image, template)
+
+    assert np.abs(actual - expected).max() <= MAX_DIFFERENCE
+    assert np.unravel_index(np.argmax(actual), actual.shape) == (50, 120)
+
+
+def test_flat_windows_and_flat_templates_match_opencv():
+    rng = np.random.default_rng(2)
+    image = rng.integers(0, 256, (160, 200), dtype=np.uint8)
+    image[20:100, 30:150] = 77  # Windows inside have no variance
+    engine = FFTEngine()
+
+    for template in (rng.integers(0, 256, (15, 21), dtype=np.uint8), np.full((15, 21), 50, dtype=np.uint8)):
+        expected = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+        assert np.abs(engine.match_template(image, template) - expected).max() <= MAX_DIFFERENCE
+
+
+def test_cached_spectra_are_reused_across_frames():
+    rng = np.random.default_rng(3)
+    engine = FFTEngine()
+    template = rng.integers(0, 256, (24, 32), dtype=np.uint8)
+
+    for _ in range(3):
+        image = rng.integers(0, 256, (180, 240), dtype=np.uint8)
+        expected = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+        assert np.abs(engine.match_template(image, template, key="template") - expected).max() <= MAX_DIFFERENCE
+    assert len(engine._spectra) == 1
+
+
+def test_locator_engines_find_the_same_matches():
+    paths = [os.path.join(RESOURCES_PATH, "0", name) for name in ("0.png", "1.png", "2.png")]
+    scene = scene_with_fragments(np.random.default_rng(4), paths, (1.0, 0.5, 1.0))
+
+    found = {}
+    for engine in ("direct", "fft"):
+        locator = ImageLocator(scale_range=(0.5, 1.1), scale_step=0.5, match_engine=engine)
+        locator.load_templates(paths)
+        matches = locator.locate_images_on_screen(scene)
+        locator.close()
+        found[engine] = sorted(matches, key=lambda m: (m['path'], m['x'], m['y']))
+
+    assert len(found["direct"]) == 3
+    assert [(m['path'], m['x'], m['y'], m['scale']) for m in found["fft"]] == \
+        [(m['path'], m['x'], m['y'], m['scale']) for m in found["direct"]]
+    for fft_match, direct_match in zip(found["fft"], found["direct"]):
+        assert fft_match['score'] == pytest.approx(direct_match['score'], abs=MAX_DIFFERENCE)
+
+
+def test_unknown_engine_is_rejected():
+    with pytest.raises(ValueError):
+        ImageLocator(match_engine="gpu")